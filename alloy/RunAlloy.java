@@ -22,11 +22,27 @@
  * using. This will continue generating instances until there are none
  * remaining. This program prints each instance to stdout for the Alloy parser
  * to parse, filter, and turn into a litmus test.
+ *
+ * With "-server", it instead reads a stream of framed models from stdin and
+ * answers each one in turn; see serve() below.
  */
 
 import java.util.*;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.FutureTask;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
 import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.EOFException;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStream;
 import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
 import java.io.PrintWriter;
 import java.io.FileNotFoundException;
 import java.io.File;
@@ -34,35 +50,60 @@ import java.io.IOException;
 import edu.mit.csail.sdg.alloy4.A4Reporter;
 import edu.mit.csail.sdg.alloy4.Err;
 import edu.mit.csail.sdg.alloy4.ErrorWarning;
+import edu.mit.csail.sdg.alloy4.Util;
 import edu.mit.csail.sdg.ast.Command;
 import edu.mit.csail.sdg.ast.CommandScope;
 import edu.mit.csail.sdg.ast.Expr;
+import edu.mit.csail.sdg.ast.ExprConstant;
 import edu.mit.csail.sdg.ast.ExprList;
 import edu.mit.csail.sdg.ast.Module;
 import edu.mit.csail.sdg.parser.CompUtil;
 import edu.mit.csail.sdg.translator.A4Options;
 import edu.mit.csail.sdg.translator.A4Solution;
+import edu.mit.csail.sdg.translator.A4Tuple;
+import edu.mit.csail.sdg.translator.A4TupleSet;
 import edu.mit.csail.sdg.translator.TranslateAlloyToKodkod;
 
 /** This class demonstrates how to access Alloy4 via the compiler methods. */
 
 public final class RunAlloy {
     public static void main(String[] args) throws Err, FileNotFoundException, IOException {
-        boolean verbose = false;
         String filename = "";
 
-        if (args.length > 1 && args[0].equals("-i")) {
-            filename = args[1];
-        }
-
         A4Reporter rep = new A4Reporter() {
             // For example, here we choose to display each "warning" by printing it to System.out
             @Override public void warning(ErrorWarning msg) {
                 System.err.print("Relevance Warning:\n"+(msg.toString().trim())+"\n\n");
                 System.err.flush();
             }
+
+            // Called once the command has been translated to CNF, just
+            // before the SAT solver starts
+            public void solve(int primaryVars, int totalVars, int clauses) {
+                stats.solveStart = System.nanoTime();
+                stats.primaryVars = primaryVars;
+                stats.totalVars = totalVars;
+                stats.clauses = clauses;
+            }
         };
 
+        if (args.length > 0 && args[0].equals("-server")) {
+            serve(rep);
+            return;
+        }
+
+        String model = null;
+        long timeout = 0;
+        for (int i = 0; i + 1 < args.length; i += 2) {
+            if (args[i].equals("-i")) {
+                filename = args[i + 1];
+            } else if (args[i].equals("-m")) {
+                model = args[i + 1];
+            } else if (args[i].equals("-t")) {
+                timeout = Long.parseLong(args[i + 1]);
+            }
+        }
+
         String input = "";
         if (filename.length() == 0) {
             Scanner scanner = new Scanner(System.in);
@@ -73,69 +114,500 @@ public final class RunAlloy {
             input = new Scanner(new File(filename)).useDelimiter("\\Z").next();
         }
 
+        System.exit(runModel(rep, input, model, new A4Options(), timeout, System.out, null));
+    }
+
+    /* Server mode: keep one JVM (and the loaded Alloy classes) alive and solve
+     * many models in sequence.  Each request is a block of "key: value" header
+     * lines, a blank line, and then exactly "length" bytes of Alloy source
+     * (or, with "transfer: chunked", a sequence of chunks).  Each response
+     * has the same shape, with a "status" header holding what would
+     * otherwise have been the process exit code, and with the command
+     * statistics (see runModel) following the output as "stats-length"
+     * further bytes.  The server exits when stdin is closed.
+     *
+     * An optional "model" header names the base module (e.g. ptx.als) that
+     * the source opens; see parse() below.  Solver options may also be given
+     * as headers; see options() below, and a "timeout-ms" header limits the
+     * time spent on each command; see solve() below.
+     *
+     * A command that is given up on leaves its solver thread running, so the
+     * response then has a "restart" header, and the server exits once it has
+     * been sent; the client starts a fresh one. */
+    static void serve(A4Reporter rep) throws IOException {
+        InputStream in = new BufferedInputStream(System.in);
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+
+        // Anything else printed to stdout would corrupt the framing
+        System.setOut(System.err);
+
+        while (true) {
+            Map<String, String> headers = readHeaders(in);
+            if (headers == null) {
+                break;
+            }
+
+            byte[] body;
+            if ("chunked".equals(headers.get("transfer"))) {
+                // The client streams the model as it generates it, as a
+                // sequence of "<hex length>\n<bytes>" chunks ending with "0\n"
+                ByteArrayOutputStream chunks = new ByteArrayOutputStream();
+                while (true) {
+                    String line = readLine(in);
+                    if (line == null) {
+                        throw new EOFException("truncated request");
+                    }
+                    int length = Integer.parseInt(line.trim(), 16);
+                    if (length == 0) {
+                        break;
+                    }
+                    chunks.write(readFully(in, length));
+                }
+                body = chunks.toByteArray();
+            } else {
+                body = readFully(in, Integer.parseInt(headers.get("length")));
+            }
+
+            ByteArrayOutputStream result = new ByteArrayOutputStream();
+            PrintStream ps = new PrintStream(result, true, "UTF-8");
+            ByteArrayOutputStream statsResult = new ByteArrayOutputStream();
+            PrintStream statsPs = new PrintStream(statsResult, true, "UTF-8");
+            int status;
+            try {
+                long timeout = headers.containsKey("timeout-ms") ? Long.parseLong(headers.get("timeout-ms")) : 0;
+                status = runModel(rep, new String(body, "UTF-8"), headers.get("model"), options(headers), timeout, ps, statsPs);
+            } catch (Exception | LinkageError e) {
+                System.err.println(e.toString());
+                status = 1;
+            } catch (OutOfMemoryError e) {
+                System.err.println(e.toString());
+                status = 1;
+                abandoned = true;
+            }
+            ps.flush();
+            statsPs.flush();
+
+            byte[] response = result.toByteArray();
+            byte[] statsResponse = statsResult.toByteArray();
+            out.write(("status: " + status + "\nlength: " + response.length +
+                        "\nstats-length: " + statsResponse.length + "\n" +
+                        (abandoned ? "restart: true\n" : "") + "\n").getBytes("UTF-8"));
+            out.write(response);
+            out.write(statsResponse);
+            out.flush();
+            if (abandoned) {
+                break;
+            }
+        }
+    }
+
+    static byte[] readFully(InputStream in, int length) throws IOException {
+        byte[] body = new byte[length];
+        int offset = 0;
+        while (offset < length) {
+            int n = in.read(body, offset, length - offset);
+            if (n < 0) {
+                throw new EOFException("truncated request");
+            }
+            offset += n;
+        }
+        return body;
+    }
+
+    /* Returns null at the end of the stream, if nothing was read */
+    static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = in.read()) != -1 && c != '\n') {
+            line.write(c);
+        }
+        if (c == -1 && line.size() == 0) {
+            return null;
+        }
+        return line.toString("UTF-8");
+    }
+
+    /* Returns null on a clean end of stream before any header */
+    static Map<String, String> readHeaders(InputStream in) throws IOException {
+        Map<String, String> headers = new HashMap<String, String>();
+        while (true) {
+            String s = readLine(in);
+            if (s == null) {
+                if (headers.isEmpty()) {
+                    return null;
+                }
+                throw new EOFException("truncated request header");
+            }
+            if (s.isEmpty()) {
+                return headers;
+            }
+            int colon = s.indexOf(':');
+            headers.put(s.substring(0, colon).trim(), s.substring(colon + 1).trim());
+        }
+    }
+
+    /* Source text of each base module, keyed by canonical path, along with
+     * the modification time it was read at */
+    static Map<String, String> baseText = new HashMap<String, String>();
+    static Map<String, Long> baseModified = new HashMap<String, Long>();
+
+    /* Parse+typecheck `input`, which opens the base module stored at `model`
+     * (or is self-contained, if `model` is null).  The base module is read
+     * from disk only once, or when it changes, and is then handed to the
+     * Alloy parser from memory alongside the per-test source.  Alloy has no
+     * API for extending an already-typechecked module with new sigs, so the
+     * base is still resolved as part of each root module. */
+    static Module parse(A4Reporter rep, String input, String model) throws Err, IOException {
+        if (model == null) {
+            return CompUtil.parseEverything_fromString(rep, input);
+        }
+
+        File file = new File(model).getCanonicalFile();
+        String path = Util.canon(file.getPath());
+        Long modified = file.lastModified();
+        if (!modified.equals(baseModified.get(path))) {
+            baseText.put(path, Util.readAll(path));
+            baseModified.put(path, modified);
+        }
+
+        // The test is parsed as if it were a file next to the base module, so
+        // that "open ptx" resolves to it
+        String root = Util.canon(new File(file.getParentFile(), "__litmus__.als").getPath());
+        Map<String, String> loaded = new HashMap<String, String>();
+        loaded.put(path, baseText.get(path));
+        loaded.put(root, input);
+        return CompUtil.parseEverything_fromFile(rep, loaded, root);
+    }
+
+    /* Solver options from request headers:
+     *   solver: a SatSolver id (e.g. "sat4j", "minisat(jni)"), or
+     *           "external:<binary> [args...]" for a DIMACS solver binary
+     *   symmetry: the symmetry-breaking predicate size (0 disables it)
+     *   skolem-depth: the maximum depth of skolemization */
+    static A4Options options(Map<String, String> headers) {
+        A4Options options = new A4Options();
+        if (headers.containsKey("solver")) {
+            options.solver = satSolver(headers.get("solver"));
+        }
+        if (headers.containsKey("symmetry")) {
+            options.symmetry = Integer.parseInt(headers.get("symmetry"));
+        }
+        if (headers.containsKey("skolem-depth")) {
+            options.skolemDepth = Integer.parseInt(headers.get("skolem-depth"));
+        }
+        return options;
+    }
+
+    /* External solvers made so far, by "external:..." name.  Alloy refuses
+     * to make a second SatSolver with an id already in use, so each command
+     * line is made into a solver once, with an id of its own, and reused by
+     * every later request on this JVM. */
+    static Map<String, A4Options.SatSolver> externalSolvers = new HashMap<String, A4Options.SatSolver>();
+
+    static synchronized A4Options.SatSolver satSolver(String name) {
+        if (name.startsWith("external:")) {
+            A4Options.SatSolver solver = externalSolvers.get(name);
+            if (solver == null) {
+                String[] command = name.substring("external:".length()).trim().split("\\s+");
+                solver = A4Options.SatSolver.make("external" + externalSolvers.size(),
+                        "External: " + String.join(" ", command),
+                        command[0], Arrays.copyOfRange(command, 1, command.length));
+                externalSolvers.put(name, solver);
+            }
+            return solver;
+        }
+        for (A4Options.SatSolver s : A4Options.SatSolver.values()) {
+            if (s.id().equalsIgnoreCase(name)) {
+                return s;
+            }
+        }
+        throw new IllegalArgumentException("unknown SAT solver " + name);
+    }
+
+    /* Timing and problem size of the command being executed, filled in by
+     * the A4Reporter.  Commands are executed one at a time. */
+    static final class Stats {
+        long solveStart;
+        int primaryVars, totalVars, clauses;
+    }
+
+    static Stats stats = new Stats();
+
+    static String ms(long nanos) {
+        return String.format(Locale.ROOT, "%.3f", nanos / 1e6);
+    }
+
+    static boolean isSanity(Command command) {
+        return !command.check && command.label.startsWith("sanity");
+    }
+
+    /* Whether the satisfiability of sanity command `command` follows from
+     * the main commands already solved.  "sanity_X" is implied by run
+     * command "X" being SAT, since X only adds conjuncts to the predicate
+     * of sanity_X; "sanity" (with no predicate) is implied by any SAT
+     * command, including a check with a counterexample. */
+    static boolean impliedSat(Command command, Map<Command, A4Solution> solutions) {
+        for (Map.Entry<Command, A4Solution> e : solutions.entrySet()) {
+            Command main = e.getKey();
+            if (isSanity(main) || !e.getValue().satisfiable()) {
+                continue;
+            }
+            if (command.label.equals("sanity")) {
+                return true;
+            }
+            if (!main.check && command.label.equals("sanity_" + main.label)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    static A4Solution execute(A4Reporter rep, Module world, Command command, A4Options options, PrintStream statsOut) throws Err {
+        stats = new Stats();
+        long start = System.nanoTime();
+        A4Solution ans = TranslateAlloyToKodkod.execute_command(rep, world.getAllReachableSigs(), command, options);
+        long end = System.nanoTime();
+
+        if (statsOut != null) {
+            // Trivial commands are decided during translation, without
+            // ever reaching the SAT solver
+            long solveStart = stats.solveStart == 0 ? end : stats.solveStart;
+            statsOut.println("{\"command\": \"" + command.label + "\"" +
+                    ", \"sat\": " + ans.satisfiable() +
+                    ", \"translate_ms\": " + ms(solveStart - start) +
+                    ", \"solve_ms\": " + ms(end - solveStart) +
+                    ", \"total_ms\": " + ms(end - start) +
+                    ", \"primary_vars\": " + stats.primaryVars +
+                    ", \"total_vars\": " + stats.totalVars +
+                    ", \"clauses\": " + stats.clauses + "}");
+        }
+        return ans;
+    }
+
+    /* The status when some command was given up on (see solve() below), and
+     * whether a solver thread has been abandoned, or the heap exhausted,
+     * since this JVM started */
+    static final int UNKNOWN = 11;
+    static boolean abandoned = false;
+
+    /* execute(), but giving up on the command after `timeout` milliseconds
+     * (if positive), or if it runs out of memory.  Returns null for a command
+     * given up on, after recording why in `unknown`.  Kodkod cannot be
+     * stopped safely part way through, so the solver thread is only
+     * interrupted, and left to finish (or not) on its own. */
+    static A4Solution solve(A4Reporter rep, Module world, Command command, A4Options options, PrintStream statsOut, long timeout, Map<Command, String> unknown) throws Err {
+        try {
+            if (timeout <= 0) {
+                return execute(rep, world, command, options, statsOut);
+            }
+            FutureTask<A4Solution> task = new FutureTask<A4Solution>(
+                    () -> execute(rep, world, command, options, statsOut));
+            Thread thread = new Thread(task, "solve " + command.label);
+            thread.setDaemon(true);
+            thread.start();
+            try {
+                return task.get(timeout, TimeUnit.MILLISECONDS);
+            } catch (TimeoutException | InterruptedException e) {
+                task.cancel(true);
+                abandoned = true;
+                unknown.put(command, "timed out after " + timeout + " ms");
+                return null;
+            } catch (ExecutionException e) {
+                Throwable cause = e.getCause();
+                if (cause instanceof Err) {
+                    throw (Err) cause;
+                } else if (cause instanceof RuntimeException) {
+                    throw (RuntimeException) cause;
+                } else if (cause instanceof Error) {
+                    throw (Error) cause;
+                }
+                throw new RuntimeException(cause);
+            }
+        } catch (OutOfMemoryError e) {
+            abandoned = true;
+            unknown.put(command, "out of memory");
+            return null;
+        }
+    }
+
+    static boolean isOutcomes(Command command) {
+        return !command.check && command.label.equals("outcomes");
+    }
+
+    /* The distinct values of `outcome` (the register values) over the
+     * instances of the "outcomes" command `command`.  Each outcome found is
+     * blocked by solving again with "not (r0.value = ... and ...)" added to
+     * the command, so the solver runs once per outcome (and once more to
+     * find there are no others), however many executions share each one.
+     * `timeout` (if positive) limits the enumeration as a whole; null is
+     * returned for an enumeration given up on, after recording why in
+     * `unknown`. */
+    static Set<String> enumerateOutcomes(A4Reporter rep, Module world, Command command, A4Options options, PrintStream statsOut, long timeout, Map<Command, String> unknown) throws Err {
+        Expr outcome = world.parseOneExpressionFromString("outcome");
+        Set<String> seen = new TreeSet<String>();
+        long deadline = System.nanoTime() + timeout * 1000000L;
+        Command blocked = command;
+        while (true) {
+            long remaining = timeout;
+            if (timeout > 0) {
+                remaining = (deadline - System.nanoTime()) / 1000000L;
+                if (remaining <= 0) {
+                    unknown.put(command, "timed out after " + timeout + " ms");
+                    return null;
+                }
+            }
+            // Only the first solve is reported in the command statistics
+            A4Solution ans = solve(rep, world, blocked, options, seen.isEmpty() ? statsOut : null, remaining, unknown);
+            if (ans == null) {
+                String why = unknown.remove(blocked);
+                unknown.put(command, why.startsWith("timed out") ? "timed out after " + timeout + " ms" : why);
+                return null;
+            }
+            if (!ans.satisfiable()) {
+                return seen;
+            }
+
+            A4TupleSet values = (A4TupleSet) ans.eval(outcome);
+            seen.add(values.toString());
+            List<String> conjuncts = new ArrayList<String>();
+            for (A4Tuple t : values) {
+                // Each register is a one sig, whose atom is named "<sig>$0"
+                String register = t.atom(0);
+                register = register.substring(0, register.indexOf('$'));
+                conjuncts.add(register + ".value = " + t.atom(1));
+            }
+            Expr found = conjuncts.isEmpty() ? ExprConstant.TRUE :
+                world.parseOneExpressionFromString(String.join(" and ", conjuncts));
+            blocked = blocked.change(blocked.formula.and(found.not()));
+        }
+    }
+
+    static void printOutcomes(Set<String> outcomes, PrintStream out) {
+        out.println("outcomes: " + outcomes.size() + " permitted");
+        for (String o : outcomes) {
+            out.println("\toutcome=" + o);
+        }
+    }
+
+    /* Runs every command in `input`, printing outcomes to `out`, and giving
+     * up on any command that takes more than `timeout` milliseconds (if
+     * positive).  If `statsOut` is non-null, a JSON object is also printed to
+     * it for the Alloy parse and then for each command, one per line. */
+    static int runModel(A4Reporter rep, String input, String model, A4Options options, long timeout, PrintStream out, PrintStream statsOut) throws Err, IOException {
+        boolean verbose = false;
+
         if (verbose) {
-            System.out.println(input);
+            out.println(input);
         }
         
         // Parse+typecheck the model
-        //Module world = CompUtil.parseEverything_fromFile(rep, null, filename);
-        Module world = CompUtil.parseEverything_fromString(rep, input);
-
-        // Choose some default options for how you want to execute the commands
-        A4Options options = new A4Options();
+        long parseStart = System.nanoTime();
+        Module world = parse(rep, input, model);
+        if (statsOut != null) {
+            statsOut.println("{\"parse_ms\": " + ms(System.nanoTime() - parseStart) + "}");
+        }
 
-        // This requires 32-bit java in windows
-        //options.solver = A4Options.SatSolver.MiniSatJNI;
+        // Each "sanity" command differs from the main commands only in the
+        // predicate, and a SAT main command already exhibits an instance
+        // satisfying its sanity command (and, for any main command, the
+        // bare "sanity" command).  So solve the main commands first, and
+        // only translate and solve a sanity command if nothing implies it.
+        List<Command> commands = world.getAllCommands();
+        Map<Command, A4Solution> solutions = new IdentityHashMap<Command, A4Solution>();
+        Map<Command, String> unknown = new IdentityHashMap<Command, String>();
+        Map<Command, Set<String>> outcomes = new IdentityHashMap<Command, Set<String>>();
+        for (Command command: commands) {
+            if (isOutcomes(command)) {
+                Set<String> o = enumerateOutcomes(rep, world, command, options, statsOut, timeout, unknown);
+                if (o != null) {
+                    outcomes.put(command, o);
+                }
+            } else if (!isSanity(command)) {
+                A4Solution ans = solve(rep, world, command, options, statsOut, timeout, unknown);
+                if (ans != null) {
+                    solutions.put(command, ans);
+                }
+            }
+        }
+        for (Command command: commands) {
+            if (isSanity(command)) {
+                if (impliedSat(command, solutions)) {
+                    if (statsOut != null) {
+                        statsOut.println("{\"command\": \"" + command.label + "\"" +
+                                ", \"sat\": true, \"implied\": true" +
+                                ", \"translate_ms\": 0, \"solve_ms\": 0, \"total_ms\": 0" +
+                                ", \"primary_vars\": 0, \"total_vars\": 0, \"clauses\": 0}");
+                    }
+                } else {
+                    A4Solution ans = solve(rep, world, command, options, statsOut, timeout, unknown);
+                    if (ans != null) {
+                        solutions.put(command, ans);
+                    }
+                }
+            }
+        }
 
-        // If there are specified commands, run them
+        // Report everything in the original order
         int exit_code = 0;
-        for (Command command: world.getAllCommands()) {
-            if (verbose) {
-                System.out.println("Executing: " + command.label);
+        for (Command command: commands) {
+            if (unknown.containsKey(command)) {
+                out.println(command.label + ": UNKNOWN, " + unknown.get(command));
+                continue;
+            }
+            if (outcomes.containsKey(command)) {
+                printOutcomes(outcomes.get(command), out);
+                continue;
+            }
+            A4Solution ans = solutions.get(command);
+            // Implied sanity commands are SAT, and print nothing
+            if (ans == null) {
+                if (verbose) {
+                    out.println(command.label + ": SAT, outcome permitted");
+                }
+                continue;
             }
-            // Execute the command
-            A4Solution ans = TranslateAlloyToKodkod.execute_command(rep, world.getAllReachableSigs(), command, options);
 
             // Print the outcome
             if (!command.check && command.label.length() >= 6 &&
                     command.label.substring(0,6).equals("check_")) {
                 if(ans.satisfiable()) {
-                    System.out.println(command.label + ": SAT, outcome permitted");
+                    out.println(command.label + ": SAT, outcome permitted");
                 } else {
-                    System.out.println(command.label + ": UNSAT, outcome not permitted");
+                    out.println(command.label + ": UNSAT, outcome not permitted");
                 }
             } else if (!command.check && command.label.length() >= 6 &&
                     command.label.substring(0,6).equals("sanity")) {
                 if(ans.satisfiable()) {
                     if (verbose) {
-                        System.out.println(command.label + ": SAT, outcome permitted");
+                        out.println(command.label + ": SAT, outcome permitted");
                     }
                 } else {
-                    System.out.println(command.label + ": UNSAT, outcome not permitted, breaks expectation");
-                    System.out.println("\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!");
+                    out.println(command.label + ": UNSAT, outcome not permitted, breaks expectation");
+                    out.println("\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!");
                     exit_code = 10;
                 }
             } else if (command.check) {
                 if(ans.satisfiable()) {
-                    System.out.println(command.label + ": SAT, assertion violated, breaks expectation");
-                    System.out.println("\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!");
+                    out.println(command.label + ": SAT, assertion violated, breaks expectation");
+                    out.println("\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!");
                     exit_code = 10;
                     Expr value = world.parseOneExpressionFromString("MemoryOp <: value");
-                    System.out.println("\tvalue=" + ans.eval(value).toString());
+                    out.println("\tvalue=" + ans.eval(value).toString());
                 } else {
-                    System.out.println(command.label + ": UNSAT, assertion confirmed, matches expectation");
+                    out.println(command.label + ": UNSAT, assertion confirmed, matches expectation");
                 }
             } else {
                 if(ans.satisfiable()) {
-                    System.out.println(command.label + ": SAT, outcome permitted, matches expectation");
+                    out.println(command.label + ": SAT, outcome permitted, matches expectation");
                 } else {
-                    System.out.println(command.label + ": UNSAT, outcome not permitted, breaks expectation");
-                    System.out.println("\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!");
+                    out.println(command.label + ": UNSAT, outcome not permitted, breaks expectation");
+                    out.println("\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!");
                     exit_code = 10;
                 }
             }
         }
 
-        System.exit(exit_code);
+        // A partial answer must not pass for a definite one
+        return unknown.isEmpty() ? exit_code : UNKNOWN;
     }
 }
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import sys
+import copy
 import output
 
 
@@ -14,18 +15,58 @@ def _s(arg, prefix="."):
         return prefix + str(arg)
 
 
+def standalone(model_text, text):
+    "inline the base model into `text` in place of its leading `open`"
+    return model_text + "\n" + text.split("\n", 1)[1]
+
+
 class AlloyEmitter:
     def __init__(self, model):
-        self.text = model + "\n"
+        # `model` is the name of the base module (e.g. "ptx"), which the
+        # solver loads once and shares between tests
+        self._fragments = [f"open {model}\n"]
+        self._out = None
         self.threads = set()
         self.blocks = set()
         self.devices = set()
         self.po_expr = {}
         self._reg_values = set()
+        self._registers = []
+
+        # For the exact scopes and Int bitwidth of each command
+        self._ops = 0
+        self._addresses = 0
+        self._max_integer = 0
+        self._atomic_adds = 0
+        self._atomic_doublings = 0
 
     def _write(self, txt):
         output.verbose("Alloy: " + txt.rstrip())
-        self.text += txt
+        if self._out is not None:
+            self._out.write(txt)
+        else:
+            self._fragments.append(txt)
+
+    @property
+    def text(self):
+        "everything written so far (unless streaming)"
+        return "".join(self._fragments)
+
+    def fork(self):
+        "a copy of the emitter, to go on from what it has written so far"
+        assert self._out is None
+        forked = copy.copy(self)
+        for k, v in vars(self).items():
+            if isinstance(v, (list, set, dict)):
+                setattr(forked, k, copy.copy(v))
+        return forked
+
+    def stream(self, out):
+        "send everything written so far, and from now on, straight to `out`"
+        for f in self._fragments:
+            out.write(f)
+        self._fragments = []
+        self._out = out
 
     def _arithmetic_op(self, op):
         try:
@@ -56,7 +97,19 @@ class AlloyEmitter:
         except KeyError:
             raise Exception(f"no Alloy mapping for proxy {proxy}")
 
+    @property
+    def bitwidth(self):
+        """
+        The fewest bits for an Alloy Int (where arithmetic wraps around) that
+        hold every constant written so far and every atomic add result
+        """
+        # An atomic add of a constant grows the largest value by at most that
+        # constant, and an add of a register by at most doubling it
+        bound = (self._max_integer + self._atomic_adds) << self._atomic_doublings
+        return bound.bit_length() + 1
+
     def integer(self, value):
+        self._max_integer = max(self._max_integer, abs(value))
         return str(value)
 
     def value(self, name):
@@ -69,6 +122,7 @@ class AlloyEmitter:
         return f" + ".join(values)
 
     def address(self, name, alias):
+        self._addresses += 1
         self._write(
             f"one sig {name} extends Address {{}}\n"
         )
@@ -107,6 +161,7 @@ class AlloyEmitter:
             self.po_expr[t] = f"{t}.start"
 
     def instruction(self, name, op):
+        self._ops += 1
         self._write(f"\n")
         self._write(f"one sig {name} extends {op} {{}}\n")
         self._write(
@@ -116,6 +171,7 @@ class AlloyEmitter:
 
     def set_register(self, reg, value, return_value):
         if reg:
+            self._registers.append(str(reg))
             self._write(f"one sig {reg} {{\n")
             self._write(f"  value: one Int,\n")
             self._write("} {\n")
@@ -192,6 +248,10 @@ class AlloyEmitter:
         store_value = self.arithmetic(
             atomic_op, [self.value(name + "_r"), value]
         )
+        try:
+            self._atomic_adds += abs(int(value))
+        except ValueError:
+            self._atomic_doublings += 1
         self.store(
             name + "_w", op2, scope, proxy, address, store_value, True, line
         )
@@ -249,6 +309,30 @@ class AlloyEmitter:
             if not sanity:
                 pred = f"{' => '.join(prefixes)} => ({pred})"
 
-        asm = f"{command} {name} {{ {pred} }} for 1 but 6 Int"
+        asm = f"{command} {name} {{ {pred} }} for {self._command_scope()}"
         self._write(f"{asm}\n\n")
         output.godbolt(f"\n{asm}", line)
+
+    def _command_scope(self):
+        # Every atom is a `one sig`, so give Alloy the exact count of each
+        # sig rather than making it search over sizes up to a bound
+        return (
+            f"exactly {self._ops} Op, exactly {len(self.po_expr)} Thread, "
+            f"exactly {len(self.blocks)} Block, "
+            f"exactly {len(self.devices)} Device, "
+            f"exactly {self._addresses} Address, {self.bitwidth} Int"
+        )
+
+    def outcomes(self):
+        """
+        A command whose instances are the executions permitted by the model,
+        and a function `outcome` giving the register values of each.  RunAlloy
+        finds each distinct outcome in turn, ruling out those already found.
+        """
+        registers = " + ".join(f"{r} -> {r}.value" for r in self._registers)
+        registers = registers or "none -> none"
+        self._write(f"fun outcome : univ -> Int {{ {registers} }}\n")
+        pred = " and ".join(["ptx_mm"] + sorted(self._reg_values))
+        asm = f"run outcomes {{ {pred} }} for {self._command_scope()}"
+        self._write(f"{asm}\n\n")
+        output.godbolt(f"\n{asm}")
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import atexit
+import threading
+import subprocess
+
+
+basepath = os.path.dirname(__file__) + "/.."
+
+
+################################################################################
+# Persistent RunAlloy process
+################################################################################
+
+
+class AlloyServerException(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class AlloyTimeout(AlloyServerException):
+    "A request ran past its time limit, and its server was killed"
+    pass
+
+
+# The status RunAlloy returns when it gave up on some command, reporting it as
+# UNKNOWN rather than SAT or UNSAT (see set_limits)
+unknown_status = 11
+
+_java_options = []
+
+
+def set_java_options(java_options):
+    "extra JVM arguments (e.g. -Djava.library.path=...) for new servers"
+    global _java_options
+    _java_options = list(java_options)
+
+
+def java_command():
+    return ["java"] + _java_options + [
+        "-cp",
+        basepath + "/alloy:" + basepath + "/alloy/org.alloytools.alloy.dist.jar",
+        "RunAlloy",
+    ]
+
+
+class AlloyServer:
+    "A single `RunAlloy -server` JVM that solves one model at a time"
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            java_command() + ["-server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        # Set once the server must not be sent further requests: it was
+        # killed, or it is exiting after giving up on a command
+        self.retired = False
+        self._expired = False
+
+    def _expire(self):
+        self._expired = True
+        self.proc.kill()
+
+    def _read_headers(self):
+        headers = {}
+        while True:
+            ln = self.proc.stdout.readline()
+            if not ln:
+                code = self.proc.wait()
+                raise AlloyServerException(
+                    f"Alloy server exited with code {code}"
+                )
+            ln = ln.decode().rstrip("\n")
+            if not ln:
+                return headers
+            key, value = ln.split(":", 1)
+            headers[key.strip()] = value.strip()
+
+    def _send(self, data):
+        try:
+            self.proc.stdin.write(data)
+        except BrokenPipeError:
+            code = self.proc.wait()
+            raise AlloyServerException(f"Alloy server exited with code {code}")
+
+    def _read(self, length):
+        data = self.proc.stdout.read(length)
+        if len(data) < length:
+            code = self.proc.wait()
+            raise AlloyServerException(f"Alloy server exited with code {code}")
+        return data
+
+    def _request(self, headers, emit, timeout=None):
+        # Past the deadline the JVM is killed, which ends the request with
+        # an exception wherever it happens to be
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self._expire)
+            timer.start()
+        try:
+            request = "".join([f"{k}: {v}\n" for k, v in headers.items()])
+            self._send(request.encode() + b"\n")
+            emit()
+            try:
+                self.proc.stdin.flush()
+            except BrokenPipeError:
+                code = self.proc.wait()
+                raise AlloyServerException(f"Alloy server exited with code {code}")
+
+            response = self._read_headers()
+            out = self._read(int(response["length"]))
+            stats = self._read(int(response.get("stats-length", 0)))
+        except AlloyServerException:
+            if self._expired:
+                raise AlloyTimeout(f"timed out after {timeout:g}s")
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+                # The timer may have fired just as the response arrived
+                self.retired = self._expired
+        self.retired = self.retired or "restart" in response
+        stats = [json.loads(ln) for ln in stats.decode().split("\n") if ln]
+        return int(response["status"]), out.decode(), stats
+
+    def run(self, text, headers={}, timeout=None):
+        """
+        Solve `text`, returning (status, stdout) as RunAlloy would, plus a
+        list of statistics dicts: one for the Alloy parse, then one for each
+        command.  Raises AlloyTimeout if that takes more than `timeout`
+        seconds.
+        """
+        body = text.encode()
+        return self._request(
+            {**headers, "length": len(body)}, lambda: self._send(body), timeout
+        )
+
+    def run_stream(self, emit, headers={}, timeout=None):
+        """
+        As run(), but the model is whatever `emit(f)` writes to the file-like
+        `f`, which is sent to the server in chunks as it is written
+        """
+        writer = _ChunkedWriter(self)
+
+        def send():
+            emit(writer)
+            writer.close()
+
+        return self._request({**headers, "transfer": "chunked"}, send, timeout)
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.proc.wait()
+
+
+class _ChunkedWriter:
+    "a file-like object that frames what is written as RunAlloy chunks"
+
+    def __init__(self, server, size=64 * 1024):
+        self._server = server
+        self._size = size
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, s):
+        self._buffer.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self._size:
+            self.flush()
+
+    def flush(self):
+        data = "".join(self._buffer).encode()
+        self._buffer = []
+        self._buffered = 0
+        if data:
+            self._server._send(f"{len(data):x}\n".encode() + data)
+
+    def close(self):
+        self.flush()
+        self._server._send(b"0\n")
+
+
+class AlloyPool:
+    "Up to `size` AlloyServers, started lazily and shared between threads"
+
+    def __init__(self, size=1):
+        self.size = size
+        # The servers not in use, most recently used last
+        self._idle = []
+        self._servers = []
+        # Notified whenever a server is put back, discarded, or may be added
+        self._available = threading.Condition()
+
+    def _acquire(self):
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._servers) < self.size:
+                    server = AlloyServer()
+                    self._servers.append(server)
+                    return server
+                self._available.wait()
+
+    def _release(self, server):
+        with self._available:
+            self._idle.append(server)
+            self._available.notify()
+
+    def _discard(self, server):
+        server.close()
+        with self._available:
+            if server in self._servers:
+                self._servers.remove(server)
+            self._available.notify()
+
+    def resize(self, size):
+        with self._available:
+            self.size = size
+            self._available.notify_all()
+
+    def _use(self, f):
+        server = self._acquire()
+        try:
+            result = f(server)
+        except BaseException:
+            # The framing may be out of sync; never reuse this server
+            self._discard(server)
+            raise
+        if server.retired:
+            self._discard(server)
+        else:
+            self._release(server)
+        return result
+
+    def run(self, text, headers={}, timeout=None):
+        return self._use(lambda server: server.run(text, headers, timeout))
+
+    def run_stream(self, emit, headers={}, timeout=None):
+        return self._use(lambda server: server.run_stream(emit, headers, timeout))
+
+    def close(self):
+        with self._available:
+            servers, self._servers = self._servers, []
+            self._idle = []
+            self._available.notify_all()
+        for s in servers:
+            s.close()
+
+
+################################################################################
+# Process-wide default pool
+################################################################################
+
+
+_pool = None
+_jobs = 1
+
+# Solver options sent as headers with every request (see RunAlloy.options)
+_options = {}
+
+
+def set_options(solver=None, symmetry=None, skolem_depth=None):
+    global _options
+    _options = {}
+    if solver is not None:
+        _options["solver"] = solver
+    if symmetry is not None:
+        _options["symmetry"] = symmetry
+    if skolem_depth is not None:
+        _options["skolem-depth"] = skolem_depth
+
+
+def options():
+    return dict(_options)
+
+
+# Time limits in seconds (None for none): RunAlloy gives up on any command
+# that takes longer than _command_timeout, and a server that spends longer
+# than _test_timeout on a whole request is killed.  Neither changes a definite
+# answer, so unlike the options they are not part of a result's cache key.
+_test_timeout = None
+_command_timeout = None
+
+
+def set_limits(test_timeout=None, command_timeout=None):
+    global _test_timeout, _command_timeout
+    _test_timeout = test_timeout
+    _command_timeout = command_timeout
+
+
+def _headers(headers):
+    limits = {}
+    if _command_timeout:
+        limits["timeout-ms"] = max(1, int(_command_timeout * 1000))
+    return {**_options, **limits, **headers}
+
+
+def set_jobs(jobs):
+    global _jobs
+    _jobs = max(1, jobs)
+    if _pool is not None:
+        _pool.resize(max(_pool.size, _jobs))
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        _pool = AlloyPool(_jobs)
+    return _pool
+
+
+def run(text, headers={}):
+    return pool().run(text, _headers(headers), _test_timeout)
+
+
+def run_stream(emit, headers={}):
+    return pool().run_stream(emit, _headers(headers), _test_timeout)
+
+
+@atexit.register
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import re
+import itertools
+from litmus import *
+
+
+################################################################################
+# Canonical forms of litmus tests
+################################################################################
+#
+# Two tests that differ only in the names of their registers, instructions,
+# threads, blocks, devices, addresses or commands have the same Alloy results,
+# up to those names.  form() serializes a parsed test with every such name
+# replaced by a number given in order of first appearance, trying each order
+# of the threads and keeping the least serialization, so that all such tests
+# share one cache entry.  It also returns the renaming of the names that show
+# up in RunAlloy output (commands, and the op and register atoms in
+# counterexamples and outcomes), which rename() applies to move an output
+# between a test and its canonical form.
+
+# Beyond this many threads only the order in the source is tried, which
+# still gives a valid (if less widely shared) key
+_max_permuted_threads = 6
+
+
+def _value(v, registers):
+    if isinstance(v, NamedValue):
+        return ("reg", registers.setdefault(v.name, len(registers)))
+    if isinstance(v, Integer):
+        return ("int", v.n)
+    if isinstance(v, Arithmetic):
+        return (v.op, tuple(_value(a, registers) for a in v.values))
+    return None
+
+
+def _condition(c, registers):
+    if isinstance(c, Equal):
+        return ("==", _value(c.a, registers), _value(c.b, registers))
+    if isinstance(c, Not):
+        return ("not", _condition(c.a, registers))
+    if isinstance(c, And):
+        return ("and", _condition(c.a, registers), _condition(c.b, registers))
+    if isinstance(c, Or):
+        return ("or", _condition(c.a, registers), _condition(c.b, registers))
+    return _value(c, registers)
+
+
+def _instruction(i, address, registers):
+    "`i` as a tuple, with its address and registers numbered"
+    if isinstance(i, Load):
+        return (
+            "ld", i.sem, i.scope, i.proxy or "generic",
+            _value(i.dst, registers), address(i.src),
+            _value(i.return_value, registers),
+        )
+    if isinstance(i, Store):
+        return (
+            "st", i.sem, i.scope, i.proxy or "generic", address(i.dst),
+            _value(i.value, registers), i.is_rmw,
+        )
+    if isinstance(i, Atom):
+        return (
+            "atom", i.atomic_op, i.sem, i.scope, i.proxy or "generic",
+            _value(i.dst, registers), address(i.src),
+            _value(i.value, registers), _value(i.return_value, registers),
+        )
+    if isinstance(i, Fence):
+        return ("fence", i.sem, i.scope)
+    if isinstance(i, ProxyFence):
+        return ("fence.proxy", i.proxy)
+    return (type(i).__name__,)
+
+
+def _op_names(i):
+    "the names under which RunAlloy may report the ops of `i`"
+    if isinstance(i, Atom):
+        return ["_r", "_w"]
+    return [""]
+
+
+def form(test):
+    """
+    Returns (text, commands, atoms): the canonical serialization of `test`,
+    and dicts from its command names, and its op and register names, to their
+    canonical names
+    """
+    # Continuations of a thread belong to it wherever they appear
+    threads = {}
+    for t in test.threads.values():
+        tid, insts = threads.setdefault(t.tid.thread(), (t.tid, []))
+        insts += t.insts
+    threads = list(threads.values())
+
+    def resolve(name):
+        seen = set()
+        while name in test.addresses and name not in seen:
+            seen.add(name)
+            a = test.addresses[name]
+            if a.alias_type != "virtually":
+                break
+            name = a.alias
+        return name
+
+    if len(threads) <= _max_permuted_threads:
+        orders = itertools.permutations(range(len(threads)))
+    else:
+        orders = [range(len(threads))]
+
+    best = None
+    for order in orders:
+        devices, blocks, addresses, registers = {}, {}, {}, {}
+
+        def address(name):
+            return addresses.setdefault(resolve(name), len(addresses))
+
+        placement, body = [], []
+        for k in order:
+            tid, insts = threads[k]
+            placement.append(
+                (
+                    devices.setdefault(tid.d, len(devices)),
+                    blocks.setdefault((tid.d, tid.b), len(blocks)),
+                )
+            )
+            body.append(
+                tuple(_instruction(i, address, registers) for i in insts)
+            )
+
+        # Declared but unused addresses still count towards the scope
+        for a in test.addresses.values():
+            if a.alias_type != "virtually":
+                address(a.name)
+        aliases = sorted(
+            (address(a.name), address(a.alias))
+            for a in test.addresses.values()
+            if a.alias_type == "physically"
+        )
+
+        commands = tuple(
+            (
+                c.expected,
+                c.name.startswith("check_"),
+                _condition(c.expr, registers),
+            )
+            for c in test.commands.values()
+        )
+
+        text = repr((placement, body, aliases, commands))
+        if best is None or text < best[0]:
+            best = (text, order, registers)
+
+    text, order, registers = best
+    atoms = {r: f"r{n}" for r, n in registers.items()}
+    ops = 0
+    for k in order:
+        for i in threads[k][1]:
+            for suffix in _op_names(i):
+                atoms[i.name + suffix] = f"i{ops}" + suffix
+                ops += 1
+    commands = {}
+    for n, name in enumerate(test.commands):
+        prefix = "check_" if name.startswith("check_") else ""
+        commands[name] = f"{prefix}c{n}"
+    return text, commands, atoms
+
+
+def command(c, atoms):
+    """
+    `c` as a tuple, with its registers numbered as in the atoms returned by
+    form() for the test it belongs to, and without its name
+    """
+    registers = {r: a for r, a in atoms.items() if re.fullmatch(r"r\d+", a)}
+    expr = _condition(c.expr, registers)
+    return (c.expected, c.name.startswith("check_"), expr)
+
+
+def invert(names):
+    return {v: k for k, v in names.items()}
+
+
+def rename(out, commands, atoms):
+    """
+    Rename the commands in RunAlloy output `out` per `commands`, and the
+    atoms in its counterexample values and outcomes per `atoms`
+    """
+
+    def label(match):
+        name = match.group(1)
+        if name in commands:
+            return commands[name] + ": "
+        if name.startswith("sanity_") and name[7:] in commands:
+            return "sanity_" + commands[name[7:]] + ": "
+        return match.group(0)
+
+    def atom(match):
+        return atoms.get(match.group(1), match.group(1)) + "$"
+
+    lines = []
+    for ln in out.split("\n"):
+        if ln.startswith("\tvalue=") or ln.startswith("\toutcome="):
+            ln = re.sub(r"\b([A-Za-z_][A-Za-z0-9_]*)\$", atom, ln)
+        else:
+            ln = re.sub("^([A-Za-z_][A-Za-z0-9_]*): ", label, ln)
+        lines.append(ln)
+    return "\n".join(lines)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import itertools
+import alloy_emitter
+from litmus import *
+
+_s = alloy_emitter._s
+
+
+################################################################################
+# Litmus test generator
+################################################################################
+#
+# Tests are enumerated as skeletons: a placement, giving the (device, block)
+# of each thread, and for each thread a tuple of (mnemonic, address) pairs,
+# with address -1 for fences.  Devices, blocks and addresses are numbered in
+# order of first appearance.  Two skeletons that differ only by a permutation
+# of the threads (and so a renaming of the scope tree and addresses) describe
+# the same test; canonical() picks one representative of each such class.
+#
+# Store values, register names and instruction names are assigned in program
+# text order when a skeleton is turned into a LitmusTest, so they carry no
+# information of their own.
+
+
+class GeneratorException(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+default_vocabulary = [
+    "ld",
+    "ld.acquire.gpu",
+    "st",
+    "st.release.gpu",
+    "fence.sc.gpu",
+]
+
+_sems = ["weak", "relaxed", "acquire", "release", "acq_rel", "sc"]
+_scopes = ["cta", "gpu", "sys"]
+
+
+def _mnemonic(mnemonic):
+    "split e.g. 'atom.add.acq_rel.gpu' into (op, atomic op, sem, scope)"
+    parts = mnemonic.split(".")
+    op, rest = parts[0], parts[1:]
+    atomic_op = None
+    if op in ["atom", "red"]:
+        if not rest or rest[0] != "add":
+            raise GeneratorException(f"'{mnemonic}': expected {op}.add")
+        atomic_op, rest = rest[0], rest[1:]
+    elif op not in ["ld", "st", "fence"]:
+        raise GeneratorException(f"'{mnemonic}': unsupported instruction")
+
+    sem = scope = None
+    for q in rest:
+        if q in _sems and sem is None and scope is None:
+            sem = q
+        elif q in _scopes and scope is None:
+            scope = q
+        else:
+            raise GeneratorException(f"'{mnemonic}': unexpected .{q}")
+    if op in ["atom", "red"]:
+        # As in the parser, atomics are .relaxed unless they say otherwise
+        if sem == "weak":
+            raise GeneratorException(f"'{mnemonic}': atomics cannot be .weak")
+        sem = sem or "relaxed"
+    elif op in ["ld", "st"] and sem in [None, "weak"]:
+        if scope:
+            raise GeneratorException(f"'{mnemonic}': weak accesses have no scope")
+        sem = "weak"
+    if sem != "weak" and scope is None:
+        raise GeneratorException(f"'{mnemonic}': strong operations need a scope")
+    if op == "fence" and sem not in ["acq_rel", "sc"]:
+        raise GeneratorException(f"'{mnemonic}': fences must be .acq_rel or .sc")
+    return op, atomic_op, sem, scope
+
+
+def check_vocabulary(vocabulary):
+    "raise a GeneratorException for the first unsupported mnemonic, if any"
+    for mnemonic in vocabulary:
+        _mnemonic(mnemonic)
+
+
+def placements(n):
+    "every placement of `n` threads, up to renaming of devices and blocks"
+
+    def extend(placement, blocks):
+        if len(placement) == n:
+            yield tuple(placement)
+            return
+        devices = len({d for d, _ in blocks})
+        # An existing block, a new block in an existing device, or both new
+        options = list(blocks)
+        options += [(d, len(blocks)) for d in range(devices)]
+        options += [(devices, len(blocks))]
+        for d, b in options:
+            yield from extend(
+                placement + [(d, b)],
+                blocks if (d, b) in blocks else blocks + [(d, b)],
+            )
+
+    return extend([], [])
+
+
+def _address_choices(n, limit):
+    "every numbering of `n` accesses by at most `limit` addresses, up to renaming"
+    if n == 0:
+        yield ()
+        return
+    for rest in _address_choices(n - 1, limit):
+        used = max(rest, default=-1) + 1
+        for a in range(min(used + 1, limit)):
+            yield rest + (a,)
+
+
+def skeletons(threads, instructions, vocabulary, addresses):
+    """
+    Every skeleton with up to `threads` threads and `instructions`
+    instructions in total, drawn from `vocabulary`, touching up to
+    `addresses` addresses.  Isomorphic skeletons are not filtered here.
+    """
+    parsed = {m: _mnemonic(m) for m in vocabulary}
+    for n in range(1, threads + 1):
+        for total in range(n, instructions + 1):
+            # Every split of `total` instructions over n non-empty threads
+            for cuts in itertools.combinations(range(1, total), n - 1):
+                lengths = [b - a for a, b in zip((0,) + cuts, cuts + (total,))]
+                for ops in itertools.product(vocabulary, repeat=total):
+                    accesses = [
+                        k for k, m in enumerate(ops) if parsed[m][0] != "fence"
+                    ]
+                    for numbering in _address_choices(len(accesses), addresses):
+                        where = dict(zip(accesses, numbering))
+                        body = [(m, where.get(k, -1)) for k, m in enumerate(ops)]
+                        split = []
+                        for length in lengths:
+                            split.append(tuple(body[:length]))
+                            body = body[length:]
+                        for placement in placements(n):
+                            yield placement, tuple(split)
+
+
+def canonical(skeleton):
+    "the least equivalent skeleton under permutation of threads"
+    placement, threads = skeleton
+    best = None
+    for order in itertools.permutations(range(len(threads))):
+        devices, blocks, names = {}, {}, {}
+        p = []
+        for i in order:
+            d, b = placement[i]
+            d = devices.setdefault(d, len(devices))
+            b = blocks.setdefault(b, len(blocks))
+            p.append((d, b))
+        t = tuple(
+            tuple(
+                (m, -1 if a < 0 else names.setdefault(a, len(names)))
+                for m, a in threads[i]
+            )
+            for i in order
+        )
+        if best is None or (tuple(p), t) < best:
+            best = (tuple(p), t)
+    return best
+
+
+def generate(
+    threads, instructions, vocabulary=default_vocabulary, addresses=2, stats=None
+):
+    """
+    Yield one canonical skeleton for each distinct test described by
+    skeletons().  If given, `stats` is kept up to date with the number of
+    skeletons "enumerated" and how many were "unique".
+    """
+    if stats is None:
+        stats = {}
+    stats["enumerated"] = stats["unique"] = 0
+    seen = set()
+    for s in skeletons(threads, instructions, vocabulary, addresses):
+        stats["enumerated"] += 1
+        c = canonical(s)
+        if c not in seen:
+            seen.add(c)
+            stats["unique"] += 1
+            yield c
+
+
+################################################################################
+# Skeletons as litmus tests
+################################################################################
+
+
+def _address_name(a):
+    return "xyzw"[a] if a < 4 else f"x{a}"
+
+
+def to_test(skeleton, model="ptx"):
+    "the LitmusTest for `skeleton`, with no commands"
+    placement, threads = skeleton
+    used = sorted({a for t in threads for _, a in t if a >= 0})
+    addresses = [Address(_address_name(a), "global") for a in used]
+
+    names = itertools.count()
+    registers = itertools.count()
+    values = itertools.count(1)
+    device = dict((b, d) for d, b in placement)
+    blocks = {}
+    per_block = {}
+    result = []
+    for (d, b), body in zip(placement, threads):
+        # Blocks are numbered within their device, threads within their block
+        if b not in blocks:
+            blocks[b] = len([c for c in blocks if device[c] == d])
+        t = per_block.get(b, 0)
+        per_block[b] = t + 1
+        thread = Thread(ThreadID(d, blocks[b], t), [])
+        for mnemonic, a in body:
+            op, atomic_op, sem, scope = _mnemonic(mnemonic)
+            name = f"i{next(names)}"
+            address = _address_name(a) if a >= 0 else None
+            if op == "ld":
+                reg = NamedValue(f"r{next(registers)}")
+                thread.append(
+                    Load(name, op, sem, scope, "generic", reg, address, NoValue())
+                )
+            elif op == "st":
+                thread.append(
+                    Store(
+                        name, op, sem, scope, "generic", address,
+                        Integer(next(values)),
+                    )
+                )
+            elif op in ["atom", "red"]:
+                reg = NamedValue(f"r{next(registers)}") if op == "atom" else None
+                thread.append(
+                    Atom(
+                        name, op, atomic_op, sem, scope, "generic", reg, address,
+                        Integer(1), NoValue(),
+                    )
+                )
+            else:
+                thread.append(Fence(name, sem, scope))
+        result.append(thread)
+    return LitmusTest(model, addresses, result, [])
+
+
+def _instruction_text(i):
+    if isinstance(i, Load):
+        return f"{i.op}{_s(i.sem)}{_s(i.scope)} {i.dst}, [{i.src}];"
+    if isinstance(i, Store):
+        return f"{i.op}{_s(i.sem)}{_s(i.scope)} [{i.dst}], {i.value};"
+    if isinstance(i, Atom):
+        dst = f"{i.dst}, " if i.dst is not None else ""
+        return (
+            f"{i.op}.{i.atomic_op}{_s(i.sem)}{_s(i.scope)} "
+            f"{dst}[{i.src}], {i.value};"
+        )
+    if isinstance(i, Fence):
+        return f"fence{_s(i.sem)}{_s(i.scope)};"
+    raise GeneratorException(f"cannot write {type(i).__name__} as litmus text")
+
+
+def litmus_text(test, commands=""):
+    "`test` in litmus test syntax, followed by `commands` (litmus text)"
+    s = "".join(f".{a.space} {a.name};\n" for a in test.addresses.values())
+    for thread in test.threads.values():
+        tid = thread.tid
+        s += f"\nd{tid.d}.b{tid.b}.t{tid.t} {{\n"
+        s += "".join(f"  {_instruction_text(i)}\n" for i in thread.insts)
+        s += "}\n"
+    if commands:
+        s += f"\n{commands}\n"
+    return s
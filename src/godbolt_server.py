@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import stat
+import socket
+import argparse
+import threading
+import socketserver
+import concurrent.futures
+import output
+import alloy_server
+import test_to_alloy
+
+
+################################################################################
+# Long-running Compiler Explorer (godbolt) server
+################################################################################
+#
+# Compiler Explorer runs `test_to_alloy.py -g` once per compile, paying for
+# Python, lark and JVM start-up every time.  This server stays up instead,
+# with the parser built and the Alloy servers running, and answers each
+# request with exactly what `test_to_alloy.py -g` would have printed.
+#
+# Requests and responses are framed as for the Alloy server: "key: value"
+# header lines, a blank line, then `length` bytes of body.  A request's body
+# is the test, and its optional `filename` header names it for the `.file`
+# directive.  The response's `status` header is the exit code
+# `test_to_alloy.py -g` would have had, or busy_status if too many requests
+# were already queued.  An `id` header in a request is echoed in its response,
+# as on stdin responses are sent as they are ready, not in request order.
+
+busy_status = 75
+
+
+def read_message(f):
+    "(headers, body) of the next message on the binary file `f`, or None at EOF"
+    headers = {}
+    while True:
+        ln = f.readline()
+        if not ln:
+            return None
+        ln = ln.decode().rstrip("\n")
+        if not ln:
+            break
+        key, value = ln.split(":", 1)
+        headers[key.strip()] = value.strip()
+    body = f.read(int(headers.get("length", 0)))
+    return headers, body.decode()
+
+
+def write_message(f, headers, body):
+    body = body.encode()
+    headers = {**headers, "length": len(body)}
+    f.write("".join(f"{k}: {v}\n" for k, v in headers.items()).encode())
+    f.write(b"\n" + body)
+    f.flush()
+
+
+class Server:
+    """
+    Compiles tests on `jobs` threads, answering busy_status at once to any
+    request that arrives while `max_queue` are already waiting or running
+    """
+
+    def __init__(self, args, jobs, max_queue):
+        self.args = args
+        self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+        self._slots = threading.BoundedSemaphore(max_queue)
+
+    def _compile(self, filename, text):
+        args = argparse.Namespace(**vars(self.args))
+        args.input = filename
+        args.alloy = ""
+        args.godbolt = True
+        args.outcomes = False
+        args.skip = 0
+        args.jobs = 1
+
+        buffer = output.capture()
+        try:
+            output.set_godbolt(True, filename)
+            output.godbolt(test_to_alloy.warning_string)
+            test_to_alloy.run_input(args, filename, text)
+            status = 0
+        except Exception as e:
+            output.always(f"// {type(e).__name__}: {e}\n")
+            status = 1
+        finally:
+            output.release()
+        return status, buffer.getvalue()
+
+    def answer(self, headers, body):
+        "the (headers, body) response to a request, once it has been compiled"
+        echo = {"id": headers["id"]} if "id" in headers else {}
+        if not self._slots.acquire(blocking=False):
+            return {**echo, "status": busy_status}, "// Server busy, try again\n"
+        try:
+            future = self._executor.submit(
+                self._compile, headers.get("filename", "<stdin>"), body
+            )
+            status, out = future.result()
+        finally:
+            self._slots.release()
+        return {**echo, "status": status}, out
+
+    def serve_stdio(self, f_in, f_out):
+        "answer requests from `f_in` on `f_out`, each as soon as it is ready"
+        lock = threading.Lock()
+        threads = []
+
+        def respond(headers, body):
+            headers, body = self.answer(headers, body)
+            with lock:
+                write_message(f_out, headers, body)
+
+        while True:
+            message = read_message(f_in)
+            if message is None:
+                break
+            t = threading.Thread(target=respond, args=message)
+            t.start()
+            threads.append(t)
+            threads = [t for t in threads if t.is_alive()]
+        for t in threads:
+            t.join()
+
+    def serve_socket(self, path):
+        "answer requests on the Unix socket `path`, in order on each connection"
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    message = read_message(self.rfile)
+                    if message is None:
+                        return
+                    write_message(self.wfile, *server.answer(*message))
+
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as s:
+            s.daemon_threads = True
+            try:
+                s.serve_forever()
+            finally:
+                os.remove(path)
+
+
+def connect(path, filename, text):
+    "send `text` to the server on `path`, print its output, and return its status"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        f = s.makefile("rwb")
+        write_message(f, {"filename": filename}, text)
+        message = read_message(f)
+    if message is None:
+        sys.stderr.write("The server closed the connection\n")
+        return 1
+    headers, body = message
+    sys.stdout.write(body)
+    return int(headers["status"])
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = argparse.ArgumentParser(
+        description="Answer Compiler Explorer (test_to_alloy.py -g) requests "
+        "from a long-running process."
+    )
+    arg_parser.add_argument(
+        "--socket",
+        dest="socket",
+        default=None,
+        help="Listen on this Unix socket (default: framed requests on stdin)",
+    )
+    arg_parser.add_argument(
+        "--max-queue",
+        dest="max_queue",
+        default=16,
+        type=int,
+        help="Refuse requests while this many are waiting or running",
+    )
+    arg_parser.add_argument(
+        "--connect",
+        dest="connect",
+        default=None,
+        help="Instead of serving, send the input to the server on this Unix "
+        "socket and print its answer, as test_to_alloy.py -g would",
+    )
+    arg_parser.add_argument(
+        dest="input",
+        nargs="?",
+        help="with --connect, the test to send (stdin if left empty)",
+    )
+    test_to_alloy.add_solver_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+
+    if args.connect:
+        if args.input:
+            with open(args.input, "r") as f:
+                text = f.read()
+        else:
+            text = sys.stdin.read()
+        sys.exit(connect(args.connect, args.input or "<stdin>", text))
+
+    test_to_alloy.apply_solver_arguments(args)
+    server = Server(args, args.jobs, args.max_queue)
+    try:
+        if args.socket:
+            server.serve_socket(args.socket)
+        else:
+            # stdout carries responses, so nothing else may be printed there
+            output.set_output(sys.stderr)
+            server.serve_stdio(sys.stdin.buffer, sys.stdout.buffer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        alloy_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
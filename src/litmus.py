@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import array
 import alloy_emitter
 
 _s = alloy_emitter._s
@@ -43,6 +44,8 @@ def _n(name):
 
 
 class Address:
+    __slots__ = ("name", "space", "alias_type", "alias")
+
     def __init__(self, name, space, alias_type=None, alias=None):
         self.name = name
         self.space = space
@@ -67,6 +70,8 @@ class Address:
 
 
 class ThreadID:
+    __slots__ = ("d", "b", "t", "line")
+
     def __init__(self, d, b, t, line=None):
         self.d = d
         self.b = b
@@ -101,6 +106,8 @@ class ThreadID:
 
 
 class Thread:
+    __slots__ = ("tid", "insts")
+
     def __init__(self, tid, insts):
         self.tid = tid
         self.insts = insts
@@ -130,10 +137,12 @@ class Thread:
 
 
 class Value:
-    pass
+    __slots__ = ()
 
 
 class NoValue(Value):
+    __slots__ = ()
+
     def __str__(self):
         return "NoValue"
 
@@ -142,6 +151,8 @@ class NoValue(Value):
 
 
 class NamedValue(Value):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -153,6 +164,8 @@ class NamedValue(Value):
 
 
 class Integer(Value):
+    __slots__ = ("n",)
+
     def __init__(self, n):
         self.n = n
 
@@ -164,6 +177,8 @@ class Integer(Value):
 
 
 class Arithmetic(Value):
+    __slots__ = ("op", "values")
+
     def __init__(self, op, values):
         self.op = op
         self.values = values
@@ -183,10 +198,14 @@ class Arithmetic(Value):
 
 
 class Instruction:
-    pass
+    __slots__ = ()
 
 
 class Load(Instruction):
+    __slots__ = (
+        "name", "op", "sem", "scope", "proxy", "dst", "src", "return_value", "line"
+    )
+
     def __init__(
         self, name, op, sem, scope, proxy, dst, src, return_value, line=None
     ):
@@ -220,6 +239,10 @@ class Load(Instruction):
 
 
 class Store(Instruction):
+    __slots__ = (
+        "name", "op", "sem", "scope", "proxy", "dst", "value", "is_rmw", "line"
+    )
+
     def __init__(
         self, name, op, sem, scope, proxy, dst, value, is_rmw=False, line=None
     ):
@@ -256,6 +279,20 @@ class Store(Instruction):
 
 
 class Atom(Instruction):
+    __slots__ = (
+        "name",
+        "op",
+        "atomic_op",
+        "sem",
+        "scope",
+        "proxy",
+        "dst",
+        "src",
+        "value",
+        "return_value",
+        "line",
+    )
+
     def __init__(
         self,
         name,
@@ -306,6 +343,8 @@ class Atom(Instruction):
 
 
 class Fence(Instruction):
+    __slots__ = ("name", "sem", "scope", "line")
+
     def __init__(self, name, sem, scope, line=None):
         self.name = name
         self.sem = sem
@@ -322,6 +361,8 @@ class Fence(Instruction):
 
 
 class ProxyFence(Instruction):
+    __slots__ = ("name", "proxy", "line")
+
     def __init__(self, name, proxy, line=None):
         self.name = name
         self.proxy = proxy
@@ -337,6 +378,8 @@ class ProxyFence(Instruction):
 
 
 class AliasFence(Instruction):
+    __slots__ = ("name", "line")
+
     def __init__(self, name, line=None):
         self.name = name
         self.line = line
@@ -354,6 +397,8 @@ class AliasFence(Instruction):
 
 
 class Command:
+    __slots__ = ("name", "expr", "expected", "line")
+
     def __init__(self, name, expr, expected, line=None):
         self.name = name
         self.expr = expr
@@ -374,6 +419,8 @@ class Command:
 
 
 class Condition:
+    __slots__ = ("op", "a", "b")
+
     def __init__(self, op, a, b):
         self.op = op
         self.a = a
@@ -387,6 +434,8 @@ class Condition:
 
 
 class Not(Condition):
+    __slots__ = ()
+
     def __init__(self, a):
         self.a = a
 
@@ -398,6 +447,8 @@ class Not(Condition):
 
 
 class And(Condition):
+    __slots__ = ()
+
     def __init__(self, a, b):
         self.a = a
         self.b = b
@@ -412,6 +463,8 @@ class And(Condition):
 
 
 class Or(Condition):
+    __slots__ = ()
+
     def __init__(self, a, b):
         self.a = a
         self.b = b
@@ -426,6 +479,8 @@ class Or(Condition):
 
 
 class Not(Condition):
+    __slots__ = ()
+
     def __init__(self, a):
         self.a = a
 
@@ -437,6 +492,8 @@ class Not(Condition):
 
 
 class Equal(Condition):
+    __slots__ = ()
+
     def __init__(self, a, b):
         self.a = a
         self.b = b
@@ -450,18 +507,299 @@ class Equal(Condition):
         )
 
 
+################################################################################
+# Instruction table
+################################################################################
+#
+# A column-per-field form of a test's threads, for holding many large tests at
+# once.  Row k is the k-th instruction in program text order, and the rows of
+# thread j are starts[j] to starts[j + 1].  Strings (names, mnemonics, sems,
+# scopes, proxies, registers) are interned into `strings` and stored as their
+# index there, and addresses as their index into `addresses`; -1 stands for
+# None in either case.  A value is a kind code and a payload: the integer
+# itself, the register's string index, or the index of any other Value in
+# `others`.
+
+_kinds = [Load, Store, Atom, Fence, ProxyFence, AliasFence]
+_no_value, _integer, _named_value, _other_value = range(4)
+
+
+class InstructionTable:
+    __slots__ = (
+        "threads",
+        "starts",
+        "strings",
+        "addresses",
+        "others",
+        "kind",
+        "name",
+        "op",
+        "atomic_op",
+        "sem",
+        "scope",
+        "proxy",
+        "address",
+        "register",
+        "value_kind",
+        "value",
+        "return_kind",
+        "return_value",
+        "is_rmw",
+        "line",
+        "_index",
+    )
+
+    def __init__(self, threads, addresses=()):
+        "the table of `threads`, numbering `addresses` (names) first"
+        self.threads = []
+        self.starts = array.array("i", [0])
+        self.strings = []
+        self.addresses = list(addresses)
+        self.others = []
+        for c in ["kind", "is_rmw"]:
+            setattr(self, c, array.array("B"))
+        for c in ["name", "op", "atomic_op", "sem", "scope", "proxy"]:
+            setattr(self, c, array.array("i"))
+        for c in ["address", "register", "value_kind", "return_kind", "line"]:
+            setattr(self, c, array.array("i"))
+        self.value = array.array("q")
+        self.return_value = array.array("q")
+
+        self._index = {}
+        addresses = {a: n for n, a in enumerate(self.addresses)}
+        for t in threads:
+            self.threads.append(t.tid)
+            for i in t.insts:
+                self._append(i, addresses)
+            self.starts.append(len(self.kind))
+        self._index = None
+
+    def __len__(self):
+        return len(self.kind)
+
+    def _string(self, s):
+        if s is None:
+            return -1
+        if s not in self._index:
+            self._index[s] = len(self.strings)
+            self.strings.append(s)
+        return self._index[s]
+
+    def _value(self, v):
+        if v is None or isinstance(v, NoValue):
+            return _no_value, 0
+        if isinstance(v, Integer):
+            return _integer, v.n
+        if isinstance(v, NamedValue):
+            return _named_value, self._string(v.name)
+        self.others.append(v)
+        return _other_value, len(self.others) - 1
+
+    def _append(self, i, addresses):
+        self.kind.append(_kinds.index(type(i)))
+        self.name.append(self._string(i.name))
+        for c in ["op", "atomic_op", "sem", "scope", "proxy"]:
+            getattr(self, c).append(self._string(getattr(i, c, None)))
+
+        address = i.dst if isinstance(i, Store) else getattr(i, "src", None)
+        if address is not None and address not in addresses:
+            addresses[address] = len(self.addresses)
+            self.addresses.append(address)
+        self.address.append(-1 if address is None else addresses[address])
+        register = None if isinstance(i, Store) else getattr(i, "dst", None)
+        if register is not None:
+            register = str(register)
+        self.register.append(self._string(register))
+
+        for kind, value, v in [
+            (self.value_kind, self.value, getattr(i, "value", None)),
+            (
+                self.return_kind,
+                self.return_value,
+                getattr(i, "return_value", None),
+            ),
+        ]:
+            k, payload = self._value(v)
+            kind.append(k)
+            value.append(payload)
+        self.is_rmw.append(bool(getattr(i, "is_rmw", False)))
+        self.line.append(-1 if i.line is None else i.line)
+
+    def _get(self, column, k):
+        n = getattr(self, column)[k]
+        return None if n < 0 else self.strings[n]
+
+    def _get_address(self, k):
+        n = self.address[k]
+        return None if n < 0 else self.addresses[n]
+
+    def _get_value(self, kinds, values, k):
+        "the Value of row `k` in the (`kinds`, `values`) columns"
+        kind, payload = kinds[k], values[k]
+        if kind == _integer:
+            return Integer(payload)
+        if kind == _named_value:
+            return NamedValue(self.strings[payload])
+        if kind == _other_value:
+            return self.others[payload]
+        return NoValue()
+
+    def _value_to_alloy(self, test, kinds, values, k):
+        "as `self._get_value(kinds, values, k).to_alloy(test)`"
+        kind, payload = kinds[k], values[k]
+        if kind == _integer:
+            return test.alloy_emitter.integer(payload)
+        if kind == _named_value:
+            return test.alloy_emitter.value(self.strings[payload])
+        if kind == _other_value:
+            return self.others[payload].to_alloy(test)
+        return None
+
+    def instruction(self, k):
+        "row `k` as an Instruction node"
+        kind = _kinds[self.kind[k]]
+        name, line = self._get("name", k), self.line[k]
+        line = None if line < 0 else line
+        register = self._get("register", k)
+        register = None if register is None else NamedValue(register)
+        value = self._get_value(self.value_kind, self.value, k)
+        return_value = self._get_value(self.return_kind, self.return_value, k)
+        sem, scope = self._get("sem", k), self._get("scope", k)
+        proxy = self._get("proxy", k)
+        if kind is Load:
+            return Load(
+                name, self._get("op", k), sem, scope, proxy, register,
+                self._get_address(k), return_value, line,
+            )
+        if kind is Store:
+            return Store(
+                name, self._get("op", k), sem, scope, proxy, self._get_address(k),
+                value, bool(self.is_rmw[k]), line,
+            )
+        if kind is Atom:
+            return Atom(
+                name, self._get("op", k), self._get("atomic_op", k), sem, scope,
+                proxy, register, self._get_address(k), value, return_value, line,
+            )
+        if kind is Fence:
+            return Fence(name, sem, scope, line)
+        if kind is ProxyFence:
+            return ProxyFence(name, proxy, line)
+        return AliasFence(name, line)
+
+    def to_threads(self):
+        "the table as a list of Thread nodes"
+        return [
+            Thread(tid, [self.instruction(k) for k in range(a, b)])
+            for tid, a, b in zip(self.threads, self.starts, self.starts[1:])
+        ]
+
+    def to_alloy(self, test):
+        "emit every thread, as each Thread's to_alloy would, but from the columns"
+        emitter = test.alloy_emitter
+        for tid, a, b in zip(self.threads, self.starts, self.starts[1:]):
+            tid.to_alloy(test)
+            for k in range(a, b):
+                self._row_to_alloy(test, emitter, k)
+
+    def _row_to_alloy(self, test, emitter, k):
+        kind = _kinds[self.kind[k]]
+        name, line = self._get("name", k), self.line[k]
+        line = None if line < 0 else line
+        sem, scope = self._get("sem", k), self._get("scope", k)
+        proxy = self._get("proxy", k)
+        if kind is Load:
+            emitter.load(
+                name, sem, scope, proxy, self._get("register", k),
+                self._get_address(k),
+                self._value_to_alloy(test, self.return_kind, self.return_value, k),
+                line,
+            )
+        elif kind is Store:
+            emitter.store(
+                name, sem, scope, proxy, self._get_address(k),
+                self._value_to_alloy(test, self.value_kind, self.value, k),
+                False, line=line,
+            )
+        elif kind is Atom:
+            emitter.atom(
+                name, self._get("atomic_op", k), sem, scope, proxy,
+                self._get("register", k), self._get_address(k),
+                self._value_to_alloy(test, self.value_kind, self.value, k),
+                self._value_to_alloy(test, self.return_kind, self.return_value, k),
+                line=line,
+            )
+        elif kind is Fence:
+            emitter.fence(name, sem, scope, line=line)
+        elif kind is ProxyFence:
+            emitter.proxy_fence(name, proxy, line=line)
+        else:
+            emitter.alias_fence(name, line=line)
+
+
 ################################################################################
 # Litmus Test
 ################################################################################
 
 
 class LitmusTest:
+    __slots__ = (
+        "model",
+        "addresses",
+        "commands",
+        "table",
+        "prefix",
+        "_threads",
+        "_alloy_emitter",
+    )
+
     def __init__(self, model, addresses, threads, commands):
+        """
+        `threads` is a list of Thread nodes or an InstructionTable.  The Alloy
+        emitter is only made once it is first needed.
+        """
+        self.model = model
         self.addresses = {a.name: a for a in addresses}
-        self.threads = {t.tid: t for t in threads}
         self.commands = {c.name: c for c in commands}
-
-        self.alloy_emitter = alloy_emitter.AlloyEmitter(model)
+        self.table = None
+        # Set by litmus_parser.TemplateTest: (emitter, n), an AlloyEmitter
+        # that has emitted the addresses and first n threads, which are the
+        # same in every instance of the template
+        self.prefix = None
+        self._threads = None
+        self._alloy_emitter = None
+        if isinstance(threads, InstructionTable):
+            self.table = threads
+        else:
+            self._threads = {t.tid: t for t in threads}
+
+    @property
+    def threads(self):
+        "the Thread nodes, by ThreadID (rebuilt from the table if compacted)"
+        if self._threads is None:
+            self._threads = {t.tid: t for t in self.table.to_threads()}
+        return self._threads
+
+    @property
+    def alloy_emitter(self):
+        if self._alloy_emitter is None:
+            self._alloy_emitter = alloy_emitter.AlloyEmitter(self.model)
+        return self._alloy_emitter
+
+    @alloy_emitter.setter
+    def alloy_emitter(self, emitter):
+        self._alloy_emitter = emitter
+
+    def compact(self):
+        """
+        Keep the threads only as an InstructionTable, dropping the Thread
+        nodes (and any emitter not yet used), and return the test
+        """
+        if self.table is None:
+            self.table = InstructionTable(self._threads.values(), self.addresses)
+        self._threads = None
+        self._alloy_emitter = None
+        return self
 
     def __str__(self):
         s = ""
@@ -479,18 +817,62 @@ class LitmusTest:
 
         return s
 
-    def to_alloy(self):
+    def emit_prefix(self, n):
+        """
+        The prefix (see __init__) for tests that share this one's addresses
+        and first `n` threads
+        """
+        emitter = self._alloy_emitter
+        self._alloy_emitter = alloy_emitter.AlloyEmitter(self.model)
+        try:
+            for a in self.addresses.values():
+                a.to_alloy(self)
+            for t in list(self.threads.values())[:n]:
+                t.to_alloy(self)
+            return self._alloy_emitter, n
+        finally:
+            self._alloy_emitter = emitter
+
+    def to_alloy(self, out=None, outcomes=False):
+        """
+        Emit the test as Alloy and return the text, or, if `out` is given,
+        write the text to `out` as it is generated and return None.  With
+        `outcomes`, the test's commands are replaced by one that enumerates
+        every permitted outcome.
+        """
+        # The prefix is only for the AlloyEmitter made here, not for any
+        # other emitter an engine has put in its place
+        prefix = self.prefix
+        if self._alloy_emitter is not None or self._threads is None:
+            prefix = None
+        skip = 0
+        if prefix is not None:
+            emitter, skip = prefix
+            self.alloy_emitter = emitter.fork()
+
+        if out is not None:
+            self.alloy_emitter.stream(out)
+
         # Emit addresses
-        for a in self.addresses.values():
-            a.to_alloy(self)
+        if prefix is None:
+            for a in self.addresses.values():
+                a.to_alloy(self)
 
         # Emit threads
-        for t in self.threads.values():
-            t.to_alloy(self)
+        if self._threads is None:
+            self.table.to_alloy(self)
+        else:
+            for t in list(self.threads.values())[skip:]:
+                t.to_alloy(self)
 
         # Emit commands
-        self.alloy_emitter.command("sanity", "", True, True, None)
-        for c in self.commands.values():
-            c.to_alloy(self)
+        if outcomes:
+            self.alloy_emitter.outcomes()
+        else:
+            self.alloy_emitter.command("sanity", "", True, True, None)
+            for c in self.commands.values():
+                c.to_alloy(self)
 
+        if out is not None:
+            return None
         return self.alloy_emitter.text
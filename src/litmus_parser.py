@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import copy
+import itertools
+import threading
 import lark
+import output
 from litmus import *
 
 
@@ -72,6 +77,12 @@ class Transformer(lark.Transformer):
         else:
             return sem, scope
 
+    def _check_atomic_sem(self, meta, sem):
+        "atomics are .relaxed unless they say otherwise, and never .volatile"
+        if sem == "volatile":
+            raise ParseException(self.text, meta, "illegal modifier .volatile")
+        return "relaxed" if sem is None else sem
+
     def load(self, meta, op, sem, scope, dst, src, return_value):
         proxy = {
             "ld": "generic",
@@ -118,8 +129,7 @@ class Transformer(lark.Transformer):
             "red": "generic",
             "sured": "surface",
         }[op]
-        if sem == "volatile":
-            raise ParseException(self.text, meta, "illegal modifier .volatile")
+        sem = self._check_atomic_sem(meta, sem)
         return Atom(
             name=self._new_id(),
             op=op,
@@ -135,13 +145,13 @@ class Transformer(lark.Transformer):
         )
 
     def red(self, meta, op, atomic_op, sem, scope, src, value):
-        if sem == "volatile":
-            raise ParseException(self.text, meta, "illegal modifier .volatile")
-        return atom(
+        sem = self._check_atomic_sem(meta, sem)
+        return Atom(
             name=self._new_id(),
             op=op,
             sem=sem,
             scope=scope,
+            proxy="surface" if op == "sured" else "generic",
             atomic_op=atomic_op,
             dst=None,
             src=src,
@@ -172,15 +182,15 @@ class Transformer(lark.Transformer):
     def alias_fence(self, meta, op):
         return AliasFence(name=self._new_id(), line=meta.line)
 
-    def sem(self, meta, dot=None, arg=None):
+    def sem(self, meta, arg=None):
         if arg:
-            return str(arg)
+            return str(arg)[1:]
         else:
             return None
 
-    def scope(self, meta, dot=None, arg=None):
+    def scope(self, meta, arg=None):
         if arg:
-            return str(arg)
+            return str(arg)[1:]
         else:
             return None
 
@@ -262,11 +272,258 @@ class Transformer(lark.Transformer):
         return Command(name, expr, expected=False, line=meta.line)
 
 
-_parser = lark.Lark(grammar, propagate_positions=True)
+def make_parser(parser="lalr", cache=True, start="start"):
+    """
+    Build the litmus test parser.  For LALR, `cache` lets lark store the
+    serialized parse tables (keyed by the grammar) and load them on later
+    runs instead of rebuilding them.  `start` is the rule (or list of rules)
+    that may be parsed.
+    """
+    if parser == "lalr":
+        return lark.Lark(
+            grammar,
+            parser="lalr",
+            propagate_positions=True,
+            cache=cache,
+            start=start,
+        )
+    return lark.Lark(grammar, parser=parser, propagate_positions=True, start=start)
+
+
+_parser = make_parser()
 
 
-def parse(model, contents):
-    return Transformer(contents, model).transform(_parser.parse(contents))
+def parse(model, contents, parser=None):
+    if parser is None:
+        parser = _parser
+    return Transformer(contents, model).transform(parser.parse(contents))
+
+
+################################################################################
+# Templates, parsed once
+################################################################################
+#
+# Most of a template is the same in every instance, so rather than parse each
+# instance in full, TemplateTest splits the template into statements (address
+# declarations, thread headers, instructions and commands, each ending at its
+# ";", "{" or "}") and parses the ones without parameters once.  The
+# parameters of an instance only have to be substituted into the statements
+# that hold them, which are parsed on their own as address declarations,
+# instructions (any number: an instruction slot like `$1` may hold none, or
+# several) or commands, and spliced in between the shared nodes.
+#
+# Parsed apart, the statements keep their line numbers but not the
+# instruction names a full parse gives them (i0, i1, ... in text order), so
+# the names are fixed up as the instance is put together.  Whenever the
+# template or an instance does not split cleanly (a parameter in a thread
+# header, a parameter holding a brace or a comment, a fragment that fails to
+# parse...), the instance is parsed in full instead, so that the result, and
+# any error, is the same as it always was.
+#
+# The Alloy emitted for the addresses and for the threads before the first
+# parameter is the same for every instance too, so it is emitted once and
+# each instance's emitter carries on from a copy of it (see
+# LitmusTest.prefix).
+
+_fragment_parser = None
+
+
+def _fragments():
+    global _fragment_parser
+    if _fragment_parser is None:
+        _fragment_parser = make_parser(
+            start=["addresses", "thread_scope_tree", "instructions", "commands"]
+        )
+    return _fragment_parser
+
+
+class _Statement:
+    def __init__(self, kind, pieces, line):
+        # "address", "header", "instruction", "command", or "end" for the
+        # brace that closes a thread
+        self.kind = kind
+        # Literal text at even indices and parameter numbers at odd ones, as
+        # in template.Template
+        self.pieces = pieces
+        self.line = line
+        # The nodes of a statement without parameters
+        self.nodes = None
+
+    def text(self, parameters):
+        pieces = self.pieces
+        text = [pieces[0]]
+        for i in range(1, len(pieces), 2):
+            n = pieces[i]
+            text.append(parameters[n].strip() if n < len(parameters) else f"${n}")
+            text.append(pieces[i + 1])
+        return "".join(text)
+
+
+class _Unsplittable(Exception):
+    pass
+
+
+def _split(pieces):
+    "the _Statements of a template body, given as template.Template.pieces"
+    statements = []
+    # "addresses", "threads" (within braces) or "after" (a thread)
+    section = "addresses"
+    commands = False
+    current = [""]
+    # The line the current statement starts on
+    line = 1
+    newlines = 0
+
+    def close(kind):
+        nonlocal current
+        if len(current) > 1 or current[0].strip():
+            statements.append(_Statement(kind, current, line))
+        current = [""]
+
+    kinds = {"addresses": "address", "threads": "instruction", "after": "command"}
+    for i, piece in enumerate(pieces):
+        if i % 2:
+            current += [piece, ""]
+            continue
+        end = 0
+        for m in re.finditer(r"//[^\n]*|[;{}]", piece):
+            if m.group(0)[0] == "/":
+                if m.end() == len(piece) and i < len(pieces) - 1:
+                    # A parameter in a comment
+                    raise _Unsplittable()
+                continue
+            current[-1] += piece[end : m.end()]
+            end = m.end()
+            if m.group(0) == ";":
+                close(kinds[section])
+                commands = commands or section == "after"
+            elif m.group(0) == "{":
+                if section == "threads" or commands or len(current) > 1:
+                    raise _Unsplittable()
+                close("header")
+                section = "threads"
+            else:
+                if section != "threads":
+                    raise _Unsplittable()
+                # Whatever is left of the thread is an instruction slot
+                current[-1] = current[-1][:-1]
+                close("instruction")
+                statements.append(_Statement("end", [""], line))
+                section = "after"
+            line = 1 + newlines + piece[:end].count("\n")
+        current[-1] += piece[end:]
+        newlines += piece.count("\n")
+    close(kinds[section])
+    return statements
+
+
+_failures = (_Unsplittable, lark.exceptions.LarkError, ParseException, LitmusException)
+
+
+class TemplateTest:
+    """
+    The template.Template `template`, parsed once, for instantiate() to turn
+    parameter lists into LitmusTests
+    """
+
+    def __init__(self, model, template):
+        self.model = model
+        self.template = template
+        self._prefix = None
+        self._prefix_threads = 0
+        self._lock = threading.Lock()
+        try:
+            self._statements = _split(template.pieces)
+            for s in self._statements:
+                if len(s.pieces) == 1:
+                    s.nodes = self._parse(s, [])
+        except _failures:
+            self._statements = None
+            return
+
+        # The threads that are the same in every instance: those before the
+        # first statement with a parameter
+        for s in self._statements:
+            if len(s.pieces) > 1:
+                break
+            if s.kind == "end":
+                self._prefix_threads += 1
+        self._static_addresses = all(
+            len(s.pieces) == 1 for s in self._statements if s.kind == "address"
+        )
+
+    def _parse(self, statement, parameters):
+        text = statement.text(parameters)
+        if statement.kind == "header":
+            text = text.rstrip()[:-1]
+        elif statement.kind == "end":
+            return []
+        start = {
+            "address": "addresses",
+            "header": "thread_scope_tree",
+            "instruction": "instructions",
+            "command": "commands",
+        }[statement.kind]
+        # Pad the fragment so that its nodes get the lines they have in the
+        # test
+        text = "\n" * (statement.line - 1) + text
+        tree = _fragments().parse(text, start=start)
+        result = Transformer(text, self.model).transform(tree)
+        return result if statement.kind == "header" else result.children
+
+    def _assemble(self, parameters):
+        addresses, threads, commands = [], [], []
+        for s in self._statements:
+            nodes = s.nodes if s.nodes is not None else self._parse(s, parameters)
+            if s.kind == "address":
+                addresses += nodes
+            elif s.kind == "header":
+                threads.append(Thread(nodes, []))
+            elif s.kind == "instruction":
+                threads[-1].insts += nodes
+            elif s.kind == "command":
+                commands += nodes
+        if any(not t.insts for t in threads):
+            raise _Unsplittable()
+
+        # Number the instructions in text order, as a full parse would
+        names = (f"i{c}" for c in itertools.count())
+        for t in threads:
+            for k, i in enumerate(t.insts):
+                name = next(names)
+                if i.name != name:
+                    i = t.insts[k] = copy.copy(i)
+                    i.name = name
+        return LitmusTest(self.model, addresses, threads, commands)
+
+    def prefix(self, test):
+        """
+        The Alloy emitted for the part of `test`, an instance, that every
+        instance shares, or None if nothing is shared
+        """
+        if not self._static_addresses:
+            return None
+        # Emitting prints the Alloy in verbose and godbolt mode, so a prefix
+        # emitted once would be missing from the output of later instances
+        if output.echoes_emission():
+            return None
+        with self._lock:
+            if self._prefix is None:
+                self._prefix = test.emit_prefix(self._prefix_threads)
+        return self._prefix
+
+    def instantiate(self, parameters):
+        "the LitmusTest for the parameter list `parameters`"
+        if self._statements is not None and not any(
+            re.search(r"[{}]|//", p) for p in parameters
+        ):
+            try:
+                test = self._assemble(parameters)
+                test.prefix = self.prefix(test)
+                return test
+            except _failures:
+                pass
+        return parse(self.model, self.template.instantiate(parameters))
 
 
 if __name__ == "__main__":
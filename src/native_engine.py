@@ -0,0 +1,911 @@
+#!/usr/bin/env python3
+
+import itertools
+import output
+import alloy_emitter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+################################################################################
+# Native execution enumeration: an alternative to Alloy for small tests
+################################################################################
+#
+# A test is walked with a NativeEmitter, which receives the same calls as the
+# AlloyEmitter (so godbolt output and op names are unchanged) but records the
+# ops rather than writing Alloy.  Every execution allowed by the facts of
+# ptx.als is then enumerated, and the ptx_mm axioms are evaluated over boolean
+# adjacency matrices, one row and column per op.
+#
+# Only the free relations of ptx.als are enumerated: rf (a source or the
+# initial value for each read), the transitive closure of co (a strict partial
+# order on each location's writes) and sc.  Everything else is fixed by the
+# facts the emitter writes.  Two choices are made where Alloy is free to pick:
+#
+#   - co is taken to be the transitive reduction of its closure, since only
+#     atomicity uses co itself rather than ^co, and fewer edges only make
+#     atomicity easier to satisfy
+#   - dep is taken to be rmw, the least it may be, as it appears only in
+#     no_thin_air
+#
+# so the engine finds an instance exactly when Alloy does.
+
+
+class NativeEngineException(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def available():
+    return np is not None
+
+
+class _Expr(str):
+    """
+    An Alloy expression, as the AlloyEmitter would write it, which also
+    carries its structure so that it can be evaluated natively
+    """
+
+    def __new__(cls, text, op, *args):
+        e = super().__new__(cls, text)
+        e.op = op
+        e.args = args
+        return e
+
+
+class _Op:
+    def __init__(self, name, kind, thread):
+        self.name = name
+        self.kind = kind
+        self.thread = thread
+        self.scope = None
+        self.proxy = None
+        self.address = None
+        self.value = None
+        self.proxies = set()
+
+
+class NativeEmitter(alloy_emitter.AlloyEmitter):
+    "An AlloyEmitter that records the test for the native engine"
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.addresses = {}
+        self.synonyms = {}
+        self.thread_ids = {}
+        self.ops = []
+        self.registers = {}
+        self.reg_values = []
+        self.rmw = []
+        self.commands = []
+        self.outcome_bitwidth = None
+
+    def _write(self, txt):
+        pass
+
+    @property
+    def text(self):
+        return ""
+
+    def integer(self, value):
+        return _Expr(super().integer(value), "int", value)
+
+    def value(self, name):
+        return _Expr(super().value(name), "value", name)
+
+    def arithmetic(self, op, values):
+        return _Expr(super().arithmetic(op, values), op, *values)
+
+    def address(self, name, alias):
+        super().address(name, alias)
+        self.addresses[name] = alias
+
+    def virtual_synonym(self, name, alias):
+        super().virtual_synonym(name, alias)
+        self.synonyms[name] = alias
+
+    def thread(self, d, b, t, line=None):
+        super().thread(d, b, t, line)
+        self.thread_ids[t] = (d, b)
+
+    def instruction(self, name, op):
+        super().instruction(name, op)
+        self.ops.append(_Op(name, op, self.current_thread))
+
+    def scoped_op(self, name, op, scope):
+        super().scoped_op(name, op, scope)
+        self.ops[-1].scope = self._scope(scope)
+
+    def memory_op(self, name, op, scope, proxy, address):
+        super().memory_op(name, op, scope, proxy, address)
+        while address in self.synonyms:
+            address = self.synonyms[address]
+        self.ops[-1].proxy = self._proxy(proxy)
+        self.ops[-1].address = address
+
+    def set_register(self, reg, value, return_value):
+        super().set_register(reg, value, return_value)
+        if reg:
+            self.registers[str(reg)] = value
+        if return_value is not None:
+            self.reg_values.append((value, return_value))
+
+    def store(self, name, sem, scope, proxy, dst, value, is_rmw, line):
+        super().store(name, sem, scope, proxy, dst, value, is_rmw, line)
+        self.ops[-1].value = value
+        if is_rmw:
+            self.rmw.append((self.ops[-2].name, name))
+
+    def proxy_fence(self, name, proxy, line):
+        super().proxy_fence(name, proxy, line)
+        self.ops[-1].proxies = {self._proxy(proxy)}
+
+    def command_and(self, a, b):
+        return _Expr(super().command_and(a, b), "and", a, b)
+
+    def command_or(self, a, b):
+        return _Expr(super().command_or(a, b), "or", a, b)
+
+    def command_not(self, a):
+        return _Expr(super().command_not(a), "not", a)
+
+    def command_equal(self, a, b):
+        return _Expr(super().command_equal(a, b), "equal", a, b)
+
+    def command(self, name, pred, sanity, expected, line):
+        output.godbolt(f"\n// {'run' if expected else 'check'} {name}", line)
+        self.commands.append((name, pred, sanity, expected, self.bitwidth))
+
+    def outcomes(self):
+        output.godbolt("\n// run outcomes")
+        self.outcome_bitwidth = self.bitwidth
+
+
+################################################################################
+# Relational helpers
+################################################################################
+
+
+def _closure(r):
+    "transitive closure (^r)"
+    c = r.copy()
+    while True:
+        n = c | (c @ c)
+        if (n == c).all():
+            return c
+        c = n
+
+
+def _acyclic(r):
+    return not _closure(r).diagonal().any()
+
+
+_posets_memo = {}
+
+
+def _posets(k):
+    "every strict partial order on range(k), as a frozenset of (a, b) pairs"
+    if k in _posets_memo:
+        return _posets_memo[k]
+    orders = [frozenset()]
+    for e in range(k):
+        extended = []
+        for order in orders:
+            subsets = [
+                {i for i in range(e) if bits >> i & 1} for bits in range(1 << e)
+            ]
+            downs = [
+                d
+                for d in subsets
+                if all(a in d for (a, b) in order if b in d)
+            ]
+            ups = [
+                u
+                for u in subsets
+                if all(b in u for (a, b) in order if a in u)
+            ]
+            for d in downs:
+                for u in ups:
+                    if d & u or any((a, b) not in order for a in d for b in u):
+                        continue
+                    extended.append(
+                        order
+                        | {(a, e) for a in d}
+                        | {(e, b) for b in u}
+                    )
+        orders = extended
+    _posets_memo[k] = orders
+    return orders
+
+
+def _reduction(pairs):
+    "the transitive reduction of a strict partial order given as pairs"
+    return {
+        (a, b)
+        for (a, b) in pairs
+        if not any((a, c) in pairs and (c, b) in pairs for (_, c) in pairs)
+    }
+
+
+################################################################################
+# Value domains for _Model.evaluate
+################################################################################
+
+
+class _Values(dict):
+    "concrete values: each read's Int, wrapping around at the bitwidth"
+
+    def __init__(self, model, values):
+        super().__init__(values)
+        self.model = model
+
+    def constant(self, n):
+        return self.model._wrap(n)
+
+    def wrap(self, v):
+        return self.model._wrap(v)
+
+
+class _Forms(dict):
+    """
+    symbolic values: each read's value as an affine form over `k` unknowns
+    (a vector of coefficients, then the constant term), modulo 2**bitwidth
+    """
+
+    def __init__(self, model, k):
+        super().__init__()
+        self.k = k
+
+    def unknown(self, i):
+        f = np.zeros(self.k + 1, dtype=int)
+        f[i] = 1
+        return f
+
+    def constant(self, n):
+        f = np.zeros(self.k + 1, dtype=int)
+        f[self.k] = n
+        return f
+
+    def wrap(self, v):
+        return v
+
+
+class _Lazy:
+    "the forms of reads, computed on demand by `form`"
+
+    def __init__(self, forms, form):
+        self.forms = forms
+        self.form = form
+
+    def __getitem__(self, r):
+        return self.form(r)
+
+    def constant(self, n):
+        return self.forms.constant(n)
+
+    def wrap(self, v):
+        return v
+
+
+################################################################################
+# Model
+################################################################################
+
+
+class _Model:
+    "The ops of one test, and the relations of ptx.als that they fix"
+
+    def __init__(self, emitter, bitwidth):
+        self.emitter = emitter
+        self.bitwidth = bitwidth
+        ops = self.ops = emitter.ops
+        n = self.n = len(ops)
+        self.index = {o.name: i for i, o in enumerate(ops)}
+
+        def mask(f):
+            return np.array([bool(f(o)) for o in ops], dtype=bool)
+
+        self.read = mask(lambda o: o.kind in ["Read", "ReadAcquire"])
+        self.write = mask(lambda o: o.kind in ["Write", "WriteRelease"])
+        self.memory = self.read | self.write
+        acquire = mask(lambda o: o.kind == "ReadAcquire")
+        release = mask(lambda o: o.kind == "WriteRelease")
+        fence = mask(lambda o: o.kind in ["FenceAcqRel", "FenceSC"])
+        self.fence_sc = mask(lambda o: o.kind == "FenceSC")
+        alias_fence = mask(lambda o: o.kind == "AliasFence")
+        proxy_fence = mask(lambda o: o.kind == "ProxyFence")
+        self.generic = mask(lambda o: o.proxy == "GenericProxy")
+        self.iden = np.eye(n, dtype=bool)
+
+        # Scopes: System, then each device, block and thread, with parents
+        scopes = ["System"]
+        parent = {"System": None}
+        for t, (d, b) in self.emitter.thread_ids.items():
+            for s, p in [(d, "System"), (b, d), (t, b)]:
+                if s not in parent:
+                    scopes.append(s)
+                    parent[s] = p
+
+        def ancestors(s):
+            while s is not None:
+                yield s
+                s = parent[s]
+
+        def op_scope(o):
+            d, b = emitter.thread_ids[o.thread]
+            return {
+                "Thread": o.thread,
+                "Block": b,
+                "Device": d,
+                "System": "System",
+            }[o.scope]
+
+        # Facts that no instance can satisfy leave the test with none at all
+        self.consistent = all(
+            o.scope != "Thread"
+            for o in ops
+            if o.kind in ["ReadAcquire", "WriteRelease", "FenceAcqRel", "FenceSC"]
+        )
+
+        scope = [op_scope(o) if o.scope else None for o in ops]
+        # op -> every scope containing its thread (ptx.als "scopes")
+        within = [set(ancestors(o.thread)) for o in ops]
+
+        # po, and the thread blocks
+        po = np.zeros((n, n), dtype=bool)
+        last = {}
+        for i, o in enumerate(ops):
+            if o.thread in last:
+                po[last[o.thread], i] = True
+            last[o.thread] = i
+        self.po = po
+        self.po_t = _closure(po)
+        self.po_s = self.iden | self.po_t
+        block = [emitter.thread_ids[o.thread][1] for o in ops]
+        same_block = np.array(
+            [[block[i] == block[j] for j in range(n)] for i in range(n)],
+            dtype=bool,
+        )
+
+        # Addresses: same_alias_r and same_location_r
+        classes = {}
+        for a in emitter.addresses:
+            classes[a] = a
+        changed = True
+        while changed:
+            changed = False
+            for a, alias in emitter.addresses.items():
+                if alias and classes[a] != classes[alias]:
+                    lo = min(classes[a], classes[alias])
+                    for b in classes:
+                        if classes[b] in [classes[a], classes[alias]]:
+                            classes[b] = lo
+                    changed = True
+        self.location = [classes.get(o.address) for o in ops]
+
+        def pairwise(f):
+            return np.array(
+                [
+                    [bool(ops[i].kind in _memory and ops[j].kind in _memory
+                          and f(i, j)) for j in range(n)]
+                    for i in range(n)
+                ],
+                dtype=bool,
+            )
+
+        self.same_alias = pairwise(lambda i, j: ops[i].address == ops[j].address)
+        self.same_location = pairwise(
+            lambda i, j: self.location[i] == self.location[j]
+        )
+        same_proxy = pairwise(lambda i, j: ops[i].proxy == ops[j].proxy)
+        self.strong_r = same_proxy & pairwise(
+            lambda i, j: scope[i] in within[j] and scope[j] in within[i]
+        )
+
+        # rmw, and the static parts of release_sequence and acquire_sequence
+        self.rmw = np.zeros((n, n), dtype=bool)
+        for r, w in emitter.rmw:
+            self.rmw[self.index[r], self.index[w]] = True
+        po_loc = self.same_alias & self.po_t
+        opt_po_loc = self.iden | po_loc
+        self.release_sequence = self.strong_r & (
+            (release[:, None] & opt_po_loc & self.write[None, :])
+            | (fence[:, None] & self.po_t & self.write[None, :])
+        )
+        self.acquire_sequence = self.strong_r & (
+            (self.read[:, None] & opt_po_loc & acquire[None, :])
+            | (self.read[:, None] & self.po_t & fence[None, :])
+        )
+
+        # proxy_fence_ops and the proxy-preserved cause base masks
+        self.proxy_fence_ops = np.array(
+            [
+                [
+                    bool(proxy_fence[i] and ops[j].proxy in ops[i].proxies
+                         and same_block[i, j])
+                    for j in range(n)
+                ]
+                for i in range(n)
+            ],
+            dtype=bool,
+        )
+        self.same_block_proxy = same_block & same_proxy
+        self.alias_fence = alias_fence
+
+        # Pairs that co (resp. sc) must order: for every scope s, the ops
+        # inside s whose own scope includes s, per address and proxy
+        def bag_pairs(members, key):
+            pairs = set()
+            for s in scopes:
+                bag = {}
+                for i in members:
+                    if s in within[i] and scope[i] in ancestors(s):
+                        bag.setdefault(key(i), []).append(i)
+                for ops_in_bag in bag.values():
+                    pairs |= set(itertools.combinations(ops_in_bag, 2))
+            return pairs
+
+        writes = [i for i in range(n) if self.write[i]]
+        self.co_total = bag_pairs(
+            writes, lambda i: (ops[i].address, ops[i].proxy)
+        )
+        self.fences_sc = [i for i in range(n) if self.fence_sc[i]]
+        self.sc_total = bag_pairs(self.fences_sc, lambda i: None)
+
+    ############################################################################
+    # Candidate executions
+
+    def _rf_choices(self):
+        "for each read, its possible rf sources (None for the initial value)"
+        writes = [i for i in range(self.n) if self.write[i]]
+        return [
+            [None] + [w for w in writes if self.same_location[w, r]]
+            for r in range(self.n)
+            if self.read[r]
+        ]
+
+    def _co_choices(self):
+        "for each location, the possible (^co, co) pairs, as matrices"
+        by_location = {}
+        for i in range(self.n):
+            if self.write[i]:
+                by_location.setdefault(self.location[i], []).append(i)
+        choices = []
+        for writes in by_location.values():
+            options = []
+            for order in _posets(len(writes)):
+                pairs = {(writes[a], writes[b]) for (a, b) in order}
+                if any(
+                    (a, b) not in pairs and (b, a) not in pairs
+                    for (a, b) in self.co_total
+                    if a in writes
+                ):
+                    continue
+                options.append((self._matrix(pairs), self._matrix(_reduction(pairs))))
+            choices.append(options)
+        return choices
+
+    def _sc_choices(self):
+        "every acyclic sc satisfying the totality facts"
+        fences = self.fences_sc
+        candidates = list(itertools.permutations(fences, 2))
+        choices = []
+        for bits in range(1 << len(candidates)):
+            sc = self._matrix(
+                {p for k, p in enumerate(candidates) if bits >> k & 1}
+            )
+            closure = _closure(sc)
+            if closure.diagonal().any():
+                continue
+            if any(
+                not closure[a, b] and not closure[b, a]
+                for (a, b) in self.sc_total
+            ):
+                continue
+            choices.append(sc)
+        return choices
+
+    def _matrix(self, pairs):
+        m = np.zeros((self.n, self.n), dtype=bool)
+        for a, b in pairs:
+            m[a, b] = True
+        return m
+
+    def rf_choices(self):
+        "yield each rf allowed by the facts, as {read: source} and a matrix"
+        if not self.consistent:
+            return
+        reads = [r for r in range(self.n) if self.read[r]]
+        for sources in itertools.product(*self._rf_choices()):
+            rf = np.zeros((self.n, self.n), dtype=bool)
+            for r, w in zip(reads, sources):
+                if w is not None:
+                    rf[w, r] = True
+            yield dict(zip(reads, sources)), rf
+
+    def orders(self):
+        "every (^co, co, sc) allowed by the facts"
+        result = []
+        for cos in itertools.product(*self._co_choices()):
+            co_t = np.zeros((self.n, self.n), dtype=bool)
+            co = co_t.copy()
+            for t, c in cos:
+                co_t |= t
+                co |= c
+            for sc in self._sc_choices():
+                result.append((co_t, co, sc))
+        return result
+
+    ############################################################################
+    # Values
+
+    def _wrap(self, v):
+        half = 1 << (self.bitwidth - 1)
+        return (v + half) % (2 * half) - half
+
+    def _reads_in(self, e):
+        "the reads whose values the value expression `e` refers to"
+        if e.op == "int":
+            return set()
+        if e.op == "value":
+            name = e.args[0]
+            if name in self.emitter.registers:
+                return self._reads_in(self.emitter.registers[name])
+            return {self.index[name]}
+        return set().union(*[self._reads_in(a) for a in e.args])
+
+    def evaluate(self, e, values):
+        """
+        Evaluate value expression `e` given `values` for the reads.  Values
+        may also be affine forms (numpy coefficient vectors with the constant
+        last), which are added without wrapping.
+        """
+        if e.op == "int":
+            return values.constant(e.args[0])
+        if e.op == "value":
+            name = e.args[0]
+            if name in self.emitter.registers:
+                return self.evaluate(self.emitter.registers[name], values)
+            return values[self.index[name]]
+        if e.op == "add":
+            return values.wrap(sum(self.evaluate(a, values) for a in e.args))
+        raise NativeEngineException(f"cannot evaluate {e}")
+
+    def values(self, sources):
+        """
+        Yield each assignment of values to reads consistent with the rf
+        `sources`.  Reads whose values depend on themselves (thin air) may
+        take any value for which their dependency cycle is consistent.
+        """
+        deps = {
+            r: (set() if w is None else self._reads_in(self.ops[w].value))
+            for r, w in sources.items()
+        }
+
+        # Reads that close a dependency cycle are unknowns; the rest follow
+        unknowns = []
+        state = {}
+
+        def visit(r):
+            state[r] = 1
+            for d in deps[r]:
+                if state.get(d) == 1:
+                    if d not in unknowns:
+                        unknowns.append(d)
+                elif d not in state:
+                    visit(d)
+            state[r] = 2
+
+        for r in deps:
+            if r not in state:
+                visit(r)
+
+        # Every read's value as an affine form in the unknowns
+        forms = _Forms(self, len(unknowns))
+        for k, u in enumerate(unknowns):
+            forms[u] = forms.unknown(k)
+
+        def form(r):
+            if r not in forms:
+                w = sources[r]
+                forms[r] = (
+                    forms.constant(0)
+                    if w is None
+                    else self.evaluate(self.ops[w].value, _Lazy(forms, form))
+                )
+            return forms[r]
+
+        for r in deps:
+            form(r)
+
+        # Solve for the unknowns one at a time, keeping only the partial
+        # assignments that satisfy every equation they fully determine
+        k = len(unknowns)
+        modulus = 1 << self.bitwidth
+        equations = []
+        for u in unknowns:
+            w = sources[u]
+            source = (
+                forms.constant(0)
+                if w is None
+                else self.evaluate(self.ops[w].value, _Lazy(forms, form))
+            )
+            equations.append(source - forms[u])
+        solutions = np.zeros((1, 0), dtype=int)
+        for j in range(-1, k):
+            if j >= 0:
+                solutions = np.hstack(
+                    [
+                        np.repeat(solutions, modulus, axis=0),
+                        np.tile(np.arange(modulus), len(solutions))[:, None],
+                    ]
+                )
+            for e in equations:
+                if not e[j + 1 : k].any():
+                    holds = (solutions @ e[: j + 1] + e[k]) % modulus == 0
+                    solutions = solutions[holds]
+            if len(solutions) > modulus**3:
+                raise NativeEngineException(
+                    "too many unconstrained values for the native engine"
+                )
+
+        for x in solutions:
+            x = np.append(x, 1)
+            yield {r: self._wrap(int(f @ x)) for r, f in forms.items()}
+
+    def write_value(self, w, values):
+        "the value of write `w`, given the values of the reads"
+        return self.evaluate(self.ops[w].value, _Values(self, values))
+
+    def holds(self, pred, values):
+        "whether command predicate `pred` holds given the read values"
+        if not isinstance(pred, _Expr):
+            return True
+        if pred.op == "and":
+            return self.holds(pred.args[0], values) and self.holds(
+                pred.args[1], values
+            )
+        if pred.op == "or":
+            return self.holds(pred.args[0], values) or self.holds(
+                pred.args[1], values
+            )
+        if pred.op == "not":
+            return not self.holds(pred.args[0], values)
+        if pred.op == "equal":
+            v = _Values(self, values)
+            return self.evaluate(pred.args[0], v) == self.evaluate(
+                pred.args[1], v
+            )
+        raise NativeEngineException(f"cannot evaluate {pred}")
+
+    ############################################################################
+    # Axioms
+
+    def ptx_mm(self, sources, rf, co_t, co, sc):
+        n = self.n
+        rmw = self.rmw
+
+        # no_thin_air, with dep = rmw
+        if not _acyclic(rf | rmw):
+            return False
+
+        observation = (rf & self.strong_r) | rmw
+        sync = self.strong_r & (
+            self.release_sequence @ _closure(observation) @ self.acquire_sequence
+        )
+        po_s = self.po_s
+        cause_base = self.po_t | (po_s @ _closure((sc | sync) @ po_s))
+
+        generic = self.generic
+        alias_fence = self.alias_fence
+        to_fence = cause_base & self.proxy_fence_ops
+        from_fence = cause_base & self.proxy_fence_ops.T
+        via_alias = cause_base @ (alias_fence[:, None] & cause_base)
+        from_fence_alias = from_fence @ (cause_base & alias_fence[None, :])
+        same_alias = self.same_alias & (
+            (generic[:, None] & cause_base & generic[None, :])
+            | (cause_base & self.same_block_proxy)
+            | ((from_fence @ cause_base) & generic[None, :])
+            | (generic[:, None] & (cause_base @ to_fence))
+            | (from_fence @ cause_base @ to_fence)
+        )
+        same_location = self.same_location & (
+            (generic[:, None] & via_alias & generic[None, :])
+            | ((from_fence_alias @ cause_base) & generic[None, :])
+            | (generic[:, None] & (via_alias @ to_fence))
+            | (from_fence_alias @ cause_base @ to_fence)
+        )
+        cause = (self.iden | observation) @ (same_alias | same_location)
+
+        initial = np.array(
+            [bool(self.read[r] and sources.get(r) is None) for r in range(n)]
+        )
+        fr = (rf.T @ co_t) | (
+            self.same_location & initial[:, None] & self.write[None, :]
+        )
+        com = rf | co_t | fr
+
+        causality = not ((self.iden | com) @ cause).diagonal().any()
+        atomicity = not (
+            ((fr & self.strong_r) @ (co & self.strong_r)) & rmw
+        ).any()
+        writes = self.write[:, None] & self.write[None, :]
+        coherence = not (self.same_location & cause & writes & ~co_t).any()
+        fences = self.fence_sc[:, None] & self.fence_sc[None, :]
+        seq_cst = not (cause & fences & ~sc).any()
+        return causality and atomicity and coherence and seq_cst
+
+
+_memory = ["Read", "ReadAcquire", "Write", "WriteRelease"]
+
+
+################################################################################
+# Running a test
+################################################################################
+
+
+def solve(emitter):
+    """
+    Decide every command recorded by `emitter`, returning a dict from command
+    name to a witness (the values of the memory ops) or None if UNSAT
+    """
+    # As in Alloy, each command is solved with its own Int bitwidth
+    witnesses = {}
+    for bitwidth in sorted({c[4] for c in emitter.commands}):
+        commands = [c for c in emitter.commands if c[4] == bitwidth]
+        witnesses.update(_solve(_Model(emitter, bitwidth), commands))
+    return witnesses
+
+
+def _register_values(emitter):
+    "the return values the loads of the test are annotated with, as predicates"
+    return [
+        _Expr("", "equal", value, expected)
+        for value, expected in emitter.reg_values
+    ]
+
+
+def _solve(model, commands):
+    emitter = model.emitter
+    register_values = _register_values(emitter)
+
+    # The predicates each command needs an instance of, and whether that
+    # instance must also satisfy ptx_mm
+    goals = {}
+    for name, pred, sanity, expected, _ in commands:
+        if sanity:
+            goals[name] = (False, [pred])
+        elif expected:
+            goals[name] = (True, register_values + [pred])
+        else:
+            goals[name] = (True, register_values + [_Expr("", "not", pred)])
+    witnesses = {name: None for name in goals}
+
+    orders = model.orders()
+    if not orders:
+        return witnesses
+
+    for sources, rf in model.rf_choices():
+        pending = [name for name in goals if witnesses[name] is None]
+        if not pending:
+            break
+        # Whether some co and sc make this rf consistent with ptx_mm; values
+        # play no part in the axioms, so this is decided at most once per rf
+        consistent = None
+        for values in model.values(sources):
+            for name in pending:
+                if witnesses[name] is not None:
+                    continue
+                needs_mm, preds = goals[name]
+                if not all(model.holds(p, values) for p in preds):
+                    continue
+                if needs_mm:
+                    if consistent is None:
+                        consistent = any(
+                            model.ptx_mm(sources, rf, *o) for o in orders
+                        )
+                    if not consistent:
+                        continue
+                witnesses[name] = {
+                    o.name: (
+                        values[i] if model.read[i] else model.write_value(i, values)
+                    )
+                    for i, o in enumerate(model.ops)
+                    if model.memory[i]
+                }
+    return witnesses
+
+
+def permitted_outcomes(emitter):
+    """
+    Every outcome permitted for the test recorded by `emitter`, as a sorted
+    list of tuples of register values (in the order of emitter.registers)
+    """
+    model = _Model(emitter, emitter.outcome_bitwidth)
+    register_values = _register_values(emitter)
+    orders = model.orders()
+    if not orders:
+        return []
+
+    found = set()
+    for sources, rf in model.rf_choices():
+        consistent = None
+        for values in model.values(sources):
+            if not all(model.holds(p, values) for p in register_values):
+                continue
+            v = _Values(model, values)
+            outcome = tuple(
+                model.evaluate(e, v) for e in emitter.registers.values()
+            )
+            if outcome in found:
+                continue
+            if consistent is None:
+                consistent = any(model.ptx_mm(sources, rf, *o) for o in orders)
+            if not consistent:
+                break
+            found.add(outcome)
+    return sorted(found)
+
+
+def run(test, model_name, outcomes=False):
+    """
+    Run `test` through the native engine, returning (status, output) in the
+    same form as RunAlloy.  With `outcomes`, list every permitted outcome
+    instead of running the test's commands.
+    """
+    if not available():
+        raise NativeEngineException(
+            "the native engine requires numpy (python3 -m pip install numpy)"
+        )
+    emitter = NativeEmitter(model_name)
+    test.alloy_emitter = emitter
+    test.to_alloy(outcomes=outcomes)
+
+    if outcomes:
+        found = permitted_outcomes(emitter)
+        out = f"outcomes: {len(found)} permitted\n"
+        for outcome in found:
+            values = ", ".join(
+                f"{r}$0->{v}" for r, v in zip(emitter.registers, outcome)
+            )
+            out += f"\toutcome={{{values}}}\n"
+        return 0, out
+
+    witnesses = solve(emitter)
+    out = ""
+    status = 0
+    for name, _, sanity, expected, _ in emitter.commands:
+        witness = witnesses[name]
+        if expected and name.startswith("check_"):
+            if witness is not None:
+                out += f"{name}: SAT, outcome permitted\n"
+            else:
+                out += f"{name}: UNSAT, outcome not permitted\n"
+        elif sanity:
+            if witness is None:
+                out += f"{name}: UNSAT, outcome not permitted, breaks expectation\n"
+                out += "\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!\n"
+                status = 10
+        elif not expected:
+            if witness is not None:
+                out += f"{name}: SAT, assertion violated, breaks expectation\n"
+                out += "\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!\n"
+                values = ", ".join(f"{k}$0->{v}" for k, v in witness.items())
+                out += f"\tvalue={{{values}}}\n"
+                status = 10
+            else:
+                out += f"{name}: UNSAT, assertion confirmed, matches expectation\n"
+        else:
+            if witness is not None:
+                out += f"{name}: SAT, outcome permitted, matches expectation\n"
+            else:
+                out += f"{name}: UNSAT, outcome not permitted, breaks expectation\n"
+                out += "\t!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!\n"
+                status = 10
+    return status, out
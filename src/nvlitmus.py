@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+import output
+import report
+import litmus_parser
+import generator
+import timing
+import alloy_server
+import result_cache
+import test_to_alloy
+
+
+def collect(paths):
+    "the .test files named by `paths`, expanding directories"
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                os.path.join(path, f)
+                for f in os.listdir(path)
+                if f.endswith(".test")
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def run_test(model, filename, n, parameters, instance, parsed=None, engine=None):
+    """
+    run one test (or template instance), returning its result as a dict;
+    `parsed` is as for test_to_alloy.parse_litmus(), and `engine` overrides
+    the --engine option
+    """
+    buffer = output.capture()
+    start = time.perf_counter()
+    error = None
+    profile = None
+    try:
+        status, out, profile = test_to_alloy.run_alloy(
+            model, instance, allow_failure=True, engine=engine, parsed=parsed
+        )
+    except Exception as e:
+        status, out, error = 1, "", str(e)
+    finally:
+        output.release()
+
+    label = filename
+    if parameters is not None:
+        label += f" #{n + 1}"
+    if profile is not None:
+        timing.record(label, profile)
+
+    commands = report.outcomes(out)
+    if profile is not None:
+        stats = {c["command"]: c for c in profile["commands"]}
+        for c in commands:
+            if c["name"] in stats:
+                c["time"] = stats[c["name"]]["total_ms"] / 1000
+                c["stats"] = stats[c["name"]]
+    return {
+        "file": filename,
+        "instance": n,
+        "parameters": parameters,
+        "status": status,
+        "error": error,
+        "time": time.perf_counter() - start,
+        "commands": commands,
+        "profile": profile,
+        "output": buffer.getvalue(),
+    }
+
+
+def _describe(result):
+    name = result["file"]
+    if result["parameters"] is not None:
+        name += f" #{result['instance'] + 1}"
+    if result["error"]:
+        verdict = "ERROR"
+    elif report.passed(result):
+        verdict = "PASS"
+    elif report.unknown(result):
+        verdict = "UNKN"
+    else:
+        verdict = "FAIL"
+    s = f"{verdict:<5} {name} ({result['time']:.2f}s)\n"
+    if result["error"]:
+        s += f"      {result['error']}\n"
+    if timing.enabled() and result["profile"]:
+        s += timing.test_summary(result["profile"])
+    for c in result["commands"]:
+        if c["matches"] is False:
+            s += f"      {c['name']}: {c['outcome']}, breaks expectation\n"
+        elif c["outcome"] == "UNKNOWN":
+            s += f"      {c['name']}: UNKNOWN, time or memory limit hit\n"
+    return s
+
+
+def expand_all(paths, model):
+    """
+    Yield every test and template instance in `paths`, as arguments for
+    run_test, reading template parameters only as they are needed
+    """
+    for filename in collect(paths):
+        with open(filename, "r") as f:
+            contents = f.read()
+        for n, (parameters, instance) in enumerate(
+            test_to_alloy.expand(contents, os.path.dirname(filename))
+        ):
+            yield model, filename, n, parameters, instance
+
+
+def shard_spec(text):
+    "parse --shard i/n, with shards numbered from 1"
+    try:
+        index, count = (int(x) for x in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}': expected i/n, e.g. 1/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"'{text}': need 1 <= i <= n")
+    return index, count
+
+
+def shard(pending, index, count, instances):
+    """
+    Yield every `count`th test in `pending`, starting from the `index`th
+    (from 1), so that shards of a template get similar instances.  Every test
+    is still enumerated, and `instances` records how many each file has.
+    """
+    for k, item in enumerate(pending):
+        _, filename, n, _, _ = item
+        instances[filename] = n + 1
+        if k % count == index - 1:
+            yield item
+
+
+def run_each(pending, jobs, verbose=False, engine=None):
+    """
+    Run every test in `pending` (which may be a generator), printing a line
+    for each and yielding its result as it finishes, in order
+    """
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        for result in test_to_alloy.map_bounded(
+            executor, lambda i: run_test(*i, engine=engine), pending, 2 * jobs
+        ):
+            if verbose:
+                output.always(result["output"])
+            output.always(_describe(result))
+            del result["output"]
+            yield result
+
+
+def run_all(pending, jobs, verbose=False, engine=None):
+    "run every test in `pending`, returning the list of their results"
+    return list(run_each(pending, jobs, verbose, engine))
+
+
+def run(args):
+    test_to_alloy.apply_solver_arguments(args)
+
+    # Instances from every file stream through one pool of Alloy servers.
+    # Only a report needs every result kept; otherwise they are just counted.
+    pending = expand_all(args.paths, args.model)
+    instances = {}
+    if args.shard:
+        pending = shard(pending, *args.shard, instances)
+    if args.json or args.junit:
+        results = run_all(pending, args.jobs, args.verbose)
+    else:
+        results = run_each(pending, args.jobs, args.verbose)
+
+    s = report.summary(results)
+    output.always(
+        f"\n{s['instances']} tests: {s['passed']} passed, {s['failed']} failed, "
+        f"{s['unknown']} unknown, {s['errors']} errors in {s['time']:.2f}s\n"
+    )
+    if timing.enabled():
+        output.always(timing.suite_summary())
+
+    if args.json:
+        with open(args.json, "w") as f:
+            report.write_json(results, f, _shard_info(args, instances))
+    if args.junit:
+        with open(args.junit, "w") as f:
+            report.write_junit(results, f)
+
+    return 0 if s["passed"] == s["instances"] else 1
+
+
+def _shard_info(args, instances):
+    if not args.shard:
+        return None
+    index, count = args.shard
+    return {
+        "index": index,
+        "count": count,
+        "paths": args.paths,
+        "model": args.model,
+        "instances": instances,
+    }
+
+
+def merge(args):
+    "combine the JSON reports of the shards of a run into one"
+    reports = []
+    for path in args.reports:
+        with open(path, "r") as f:
+            reports.append(json.load(f))
+    results, problems = report.merge(reports)
+
+    for result in results:
+        if not report.passed(result):
+            output.always(_describe(result))
+    for problem in problems:
+        output.always(f"// {problem}\n")
+
+    s = report.summary(results)
+    output.always(
+        f"\n{s['instances']} tests: {s['passed']} passed, {s['failed']} failed, "
+        f"{s['unknown']} unknown, {s['errors']} errors in {s['time']:.2f}s, "
+        f"from {len(reports)} reports\n"
+    )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            report.write_json(results, f)
+    if args.junit:
+        with open(args.junit, "w") as f:
+            report.write_junit(results, f)
+
+    if problems:
+        return 2
+    return 0 if s["passed"] == s["instances"] else 1
+
+
+def _disagreements(runs):
+    """
+    count (and print) the tests on which any run in `runs`, a dict from name
+    to (wall time, results), has different outcomes from the first
+    """
+    disagreements = 0
+    names = list(runs)
+    for i, reference in enumerate(runs[names[0]][1]):
+        expected = [(c["name"], c["outcome"]) for c in reference["commands"]]
+        for name in names[1:]:
+            other = runs[name][1][i]
+            if other["error"] or reference["error"]:
+                continue
+            # A command given up on in either run agrees with anything
+            unknown = {
+                c["name"]
+                for r in [reference, other]
+                for c in r["commands"]
+                if c["outcome"] == "UNKNOWN"
+            }
+            actual = [(c["name"], c["outcome"]) for c in other["commands"]]
+            if [c for c in actual if c[0] not in unknown] != [
+                c for c in expected if c[0] not in unknown
+            ]:
+                disagreements += 1
+                output.always(
+                    f"// {name} disagrees with {names[0]} on "
+                    f"{reference['file']} #{reference['instance'] + 1}\n"
+                )
+    return disagreements
+
+
+def bench(args):
+    "run the suite once per solver and compare their times and outcomes"
+    test_to_alloy.apply_solver_arguments(args)
+    result_cache.set_enabled(False)
+    pending = list(expand_all(args.paths, args.model))
+
+    runs = {}
+    for name in args.solvers.split(","):
+        output.always(f"\n// Solver {name}\n")
+        alloy_server.set_options(
+            test_to_alloy.solver_id(name), args.symmetry, args.skolem_depth
+        )
+        start = time.perf_counter()
+        results = run_all(pending, args.jobs, args.verbose)
+        runs[name] = (time.perf_counter() - start, results)
+
+    output.always(
+        f"\n{'solver':<16} {'wall (s)':>10} {'sum (s)':>10} {'passed':>8} "
+        f"{'errors':>8}\n"
+    )
+    for name, (wall, results) in runs.items():
+        s = report.summary(results)
+        output.always(
+            f"{name:<16} {wall:>10.2f} {s['time']:>10.2f} {s['passed']:>8} "
+            f"{s['errors']:>8}\n"
+        )
+
+    disagreements = _disagreements(runs)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    name: {"wall": wall, **report.summary(results), "tests": results}
+                    for name, (wall, results) in runs.items()
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+
+    return 1 if disagreements else 0
+
+
+def conform(args):
+    "check that the other engines agree with the first on every test"
+    test_to_alloy.apply_solver_arguments(args)
+    pending = list(expand_all(args.paths, args.model))
+
+    runs = {}
+    for engine in args.engines.split(","):
+        output.always(f"\n// Engine {engine}\n")
+        start = time.perf_counter()
+        results = run_all(pending, args.jobs, args.verbose, engine)
+        runs[engine] = (time.perf_counter() - start, results)
+
+    output.always(f"\n{'engine':<16} {'wall (s)':>10} {'errors':>8}\n")
+    for name, (wall, results) in runs.items():
+        s = report.summary(results)
+        output.always(f"{name:<16} {wall:>10.2f} {s['errors']:>8}\n")
+
+    disagreements = _disagreements(runs)
+    output.always(f"\n{disagreements} disagreements in {len(pending)} tests\n")
+    errors = sum(report.summary(r)["errors"] for _, r in runs.values())
+    return 1 if disagreements or errors else 0
+
+
+def _generated(args, vocabulary, stats):
+    "yield (name, text) for each distinct test, as it is enumerated"
+    for n, skeleton in enumerate(
+        generator.generate(
+            args.threads, args.instructions, vocabulary, args.addresses, stats
+        )
+    ):
+        text = generator.litmus_text(generator.to_test(skeleton), args.commands)
+        yield f"generated_{n}.test", text
+
+
+def _compacted(model, text):
+    "a `parsed` hook for run_test(): `text`, parsed now and held compacted"
+    test = litmus_parser.parse(test_to_alloy.model_name(model), text).compact()
+    return lambda: test
+
+
+def generate(args):
+    "enumerate distinct tests, writing, printing or running each as it is found"
+    vocabulary = args.ops.split(",")
+    try:
+        generator.check_vocabulary(vocabulary)
+    except generator.GeneratorException as e:
+        sys.stderr.write(f"{e}\n")
+        return 1
+    stats = {}
+    tests = _generated(args, vocabulary, stats)
+
+    s = None
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        for name, text in tests:
+            with open(os.path.join(args.output, name), "w") as f:
+                f.write(text)
+    elif not args.run:
+        for name, text in tests:
+            output.always(f"// {name}\n{text}\n")
+    else:
+        test_to_alloy.apply_solver_arguments(args)
+        # Tests queued for the workers are held as InstructionTables
+        pending = (
+            (args.model, name, 0, None, text, _compacted(args.model, text))
+            for name, text in tests
+        )
+        s = report.summary(run_each(pending, args.jobs, args.verbose))
+
+    output.always(
+        f"// {stats['enumerated']} tests enumerated, {stats['unique']} distinct "
+        f"up to renaming of threads, scopes and addresses\n"
+    )
+    if s is None:
+        return 0
+    output.always(
+        f"\n{s['instances']} tests: {s['passed']} passed, {s['failed']} failed, "
+        f"{s['unknown']} unknown, {s['errors']} errors in {s['time']:.2f}s\n"
+    )
+    return 0 if s["passed"] == s["instances"] else 1
+
+
+def bench_parse(args):
+    "compare building and running the Earley and LALR litmus parsers"
+    texts = [i for _, _, _, _, i in expand_all(args.paths, args.model)]
+    model = test_to_alloy.model_name(args.model)
+
+    # Make sure the serialized LALR tables exist before timing a load
+    litmus_parser.make_parser("lalr", cache=True)
+
+    output.always(
+        f"{len(texts)} instances, {args.repeat} repetitions\n\n"
+        f"{'parser':<16} {'build (ms)':>12} {'parse (ms/instance)':>20}\n"
+    )
+    for name, kind, cache in [
+        ("earley", "earley", False),
+        ("lalr", "lalr", False),
+        ("lalr (cached)", "lalr", True),
+    ]:
+        start = time.perf_counter()
+        parser = litmus_parser.make_parser(kind, cache=cache)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for t in texts:
+                litmus_parser.parse(model, t, parser)
+        each = (time.perf_counter() - start) / (args.repeat * len(texts))
+
+        output.always(f"{name:<16} {build * 1000:>12.2f} {each * 1000:>20.3f}\n")
+    return 0
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = argparse.ArgumentParser(
+        description="Run suites of PTX-like litmus tests through Alloy."
+    )
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="run every test in the given files and directories"
+    )
+    run_parser.add_argument(
+        dest="paths", nargs="+", help=".test files or directories of them"
+    )
+    test_to_alloy.add_solver_arguments(run_parser)
+    run_parser.add_argument(
+        "--json", dest="json", default="", help="write a JSON report here"
+    )
+    run_parser.add_argument(
+        "--junit", dest="junit", default="", help="write a JUnit XML report here"
+    )
+    run_parser.add_argument(
+        "--shard",
+        dest="shard",
+        default=None,
+        type=shard_spec,
+        help="run only shard i of n (e.g. 2/8) of the tests and instances; "
+        "combine the shards' --json reports with 'merge'",
+    )
+    run_parser.add_argument(
+        "-v", dest="verbose", action="store_true", help="print each test's output"
+    )
+    run_parser.set_defaults(func=run)
+
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="combine the JSON reports of a sharded run, checking that every "
+        "instance was run exactly once",
+    )
+    merge_parser.add_argument(dest="reports", nargs="+", help="JSON reports")
+    merge_parser.add_argument(
+        "--json", dest="json", default="", help="write the merged JSON report here"
+    )
+    merge_parser.add_argument(
+        "--junit", dest="junit", default="", help="write a JUnit XML report here"
+    )
+    merge_parser.set_defaults(func=merge)
+
+    bench_parser = subparsers.add_parser(
+        "bench", help="compare SAT solver backends on the given tests"
+    )
+    bench_parser.add_argument(
+        dest="paths", nargs="+", help=".test files or directories of them"
+    )
+    test_to_alloy.add_solver_arguments(bench_parser)
+    bench_parser.add_argument(
+        "--solvers",
+        dest="solvers",
+        default="sat4j,minisat,glucose,lingeling",
+        help="comma-separated list of solvers to compare",
+    )
+    bench_parser.add_argument(
+        "--json", dest="json", default="", help="write per-solver results here"
+    )
+    bench_parser.add_argument(
+        "-v", dest="verbose", action="store_true", help="print each test's output"
+    )
+    bench_parser.set_defaults(func=bench)
+
+    conform_parser = subparsers.add_parser(
+        "conform", help="check the native engine against Alloy on the given tests"
+    )
+    conform_parser.add_argument(
+        dest="paths", nargs="+", help=".test files or directories of them"
+    )
+    conform_parser.add_argument(
+        "--engines",
+        dest="engines",
+        default="alloy,native",
+        help="Comma-separated engines to compare, the first being the reference",
+    )
+    test_to_alloy.add_solver_arguments(conform_parser)
+    conform_parser.add_argument(
+        "-v", dest="verbose", action="store_true", help="print each test's output"
+    )
+    conform_parser.set_defaults(func=conform)
+
+    generate_parser = subparsers.add_parser(
+        "generate",
+        help="enumerate litmus tests, one per class of equivalent tests",
+    )
+    generate_parser.add_argument(
+        "--threads", dest="threads", default=2, type=int,
+        help="at most this many threads",
+    )
+    generate_parser.add_argument(
+        "--instructions", dest="instructions", default=4, type=int,
+        help="at most this many instructions across all threads",
+    )
+    generate_parser.add_argument(
+        "--addresses", dest="addresses", default=2, type=int,
+        help="at most this many addresses",
+    )
+    generate_parser.add_argument(
+        "--ops",
+        dest="ops",
+        default=",".join(generator.default_vocabulary),
+        help="comma-separated instructions to draw from, e.g. "
+        "ld.relaxed.gpu,st.release.cta,atom.add.acq_rel.gpu,fence.sc.gpu",
+    )
+    generate_parser.add_argument(
+        "--commands",
+        dest="commands",
+        default="",
+        help="litmus commands to append to every test, e.g. "
+        "'check(r0 == 1 && r1 == 0) as weak;' (loads write r0, r1, ... in "
+        "order, and stores write 1, 2, ... in order)",
+    )
+    generate_parser.add_argument(
+        "-o", dest="output", default="", help="write the tests to this directory"
+    )
+    generate_parser.add_argument(
+        "--run", dest="run", action="store_true",
+        help="run the generated tests instead of printing them",
+    )
+    test_to_alloy.add_solver_arguments(generate_parser)
+    generate_parser.add_argument(
+        "-v", dest="verbose", action="store_true", help="print each test's output"
+    )
+    generate_parser.set_defaults(func=generate)
+
+    bench_parse_parser = subparsers.add_parser(
+        "bench-parser",
+        help="compare litmus parser start-up and per-instance parse times",
+    )
+    bench_parse_parser.add_argument(
+        dest="paths", nargs="+", help=".test files or directories of them"
+    )
+    bench_parse_parser.add_argument(
+        "-m",
+        dest="model",
+        default=test_to_alloy.basepath + "/alloy/ptx.als",
+        help="Alloy model",
+    )
+    bench_parse_parser.add_argument(
+        "-r",
+        dest="repeat",
+        default=5,
+        type=int,
+        help="parse every instance this many times",
+    )
+    bench_parse_parser.set_defaults(func=bench_parse)
+
+    args = arg_parser.parse_args(argv)
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+import io
 import sys
+import threading
 
 
 output = sys.stdout
@@ -10,8 +12,34 @@ def set_output(f):
     output = f
 
 
+# Per-thread capture buffers, so that tests run concurrently can each
+# collect their output and have it replayed in order.  Captures nest: the
+# innermost one receives the output.
+_local = threading.local()
+
+
+def _stream():
+    buffers = getattr(_local, "buffers", None)
+    if not buffers:
+        return output
+    return buffers[-1]
+
+
+def capture():
+    "send this thread's output to a new buffer, which is returned"
+    if getattr(_local, "buffers", None) is None:
+        _local.buffers = []
+    _local.buffers.append(io.StringIO())
+    return _local.buffers[-1]
+
+
+def release():
+    "stop the innermost capture of this thread's output"
+    _local.buffers.pop()
+
+
 def always(s):
-    output.write(str(s))
+    _stream().write(str(s))
 
 
 _info = True
@@ -24,7 +52,7 @@ def set_info(info):
 
 def info(s):
     if _info:
-        output.write(str(s))
+        _stream().write(str(s))
 
 
 _verbose = False
@@ -37,7 +65,7 @@ def set_verbose(verbose):
 
 def verbose(s):
     if _info and _verbose:
-        output.write(str(s))
+        _stream().write(str(s))
 
 
 _godbolt_mode = False
@@ -51,8 +79,13 @@ def set_godbolt(mode, filename):
     always(f".file 1 \"{filename}\"\n")
 
 
+def echoes_emission():
+    "whether emitting Alloy also prints it (in verbose or godbolt mode)"
+    return _godbolt_mode or (_info and _verbose)
+
+
 def godbolt(s, line=None):
     if _godbolt_mode:
         if line is not None:
-            output.write(f".loc 1 {line} 1\n")
-        output.write(f"{s}\n")
+            _stream().write(f".loc 1 {line} 1\n")
+        _stream().write(f"{s}\n")
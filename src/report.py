@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import re
+import json
+import xml.etree.ElementTree as ET
+
+
+################################################################################
+# Structured results from RunAlloy output
+################################################################################
+
+
+def outcomes(out):
+    """
+    The per-command results in RunAlloy output `out`, as a list of dicts with
+    the command name, its SAT/UNSAT outcome (or UNKNOWN, if a limit was hit),
+    and whether that matches the expectation (None for commands that have no
+    expectation, or no outcome).  Callers may
+    add the command's "time" and solver "stats".
+    """
+    result = []
+    for ln in out.split("\n"):
+        match = re.search("^([A-Za-z_][A-Za-z0-9_]*): (SAT|UNSAT|UNKNOWN)(.*)$", ln)
+        if not match:
+            continue
+        name, outcome, rest = match.groups()
+        if "breaks expectation" in rest:
+            matches = False
+        elif "matches expectation" in rest:
+            matches = True
+        else:
+            matches = None
+        result.append({"name": name, "outcome": outcome, "matches": matches})
+    return result
+
+
+def passed(result):
+    "whether a test result (see nvlitmus.run_test) met every expectation"
+    return result["error"] is None and result["status"] == 0
+
+
+def unknown(result):
+    """
+    whether a test result hit a time or memory limit (see
+    alloy_server.set_limits) before any of its commands broke an expectation
+    """
+    return (
+        result["error"] is None
+        and result["status"] == 11
+        and not any(c["matches"] is False for c in result["commands"])
+    )
+
+
+################################################################################
+# Report writers
+################################################################################
+
+
+def summary(results):
+    "counts and total time of `results`, which are consumed in one pass"
+    s = {
+        "instances": 0,
+        "passed": 0,
+        "failed": 0,
+        "unknown": 0,
+        "errors": 0,
+        "time": 0.0,
+    }
+    for r in results:
+        s["instances"] += 1
+        if r["error"]:
+            s["errors"] += 1
+        elif passed(r):
+            s["passed"] += 1
+        elif unknown(r):
+            s["unknown"] += 1
+        else:
+            s["failed"] += 1
+        s["time"] += r["time"]
+    return s
+
+
+def write_json(results, f, shard=None):
+    """
+    Write `results` as a JSON report.  The report of one shard of a run also
+    records which shard it is, as `shard` (see nvlitmus.shard), so that
+    merge() can check the shards' reports against each other.
+    """
+    report = {"summary": summary(results)}
+    if shard is not None:
+        report["shard"] = shard
+    report["tests"] = results
+    json.dump(report, f, indent=2)
+    f.write("\n")
+
+
+def write_junit(results, f):
+    suites = ET.Element("testsuites")
+    by_file = {}
+    for r in results:
+        by_file.setdefault(r["file"], []).append(r)
+
+    for filename, file_results in by_file.items():
+        suite = ET.SubElement(
+            suites,
+            "testsuite",
+            name=filename,
+            time=f"{summary(file_results)['time']:.3f}",
+        )
+        for r in file_results:
+            classname = filename
+            if r["parameters"] is not None:
+                classname += f"[{r['instance']}]"
+
+            if r["error"]:
+                case = ET.SubElement(
+                    suite,
+                    "testcase",
+                    classname=classname,
+                    name="error",
+                    time=f"{r['time']:.3f}",
+                )
+                ET.SubElement(case, "error", message=r["error"])
+                continue
+
+            for c in r["commands"]:
+                case = ET.SubElement(
+                    suite,
+                    "testcase",
+                    classname=classname,
+                    name=c["name"],
+                    time=f"{c.get('time', r['time']):.3f}",
+                )
+                if c["matches"] is False:
+                    ET.SubElement(
+                        case,
+                        "failure",
+                        message=f"{c['outcome']}, breaks expectation",
+                    )
+                elif c["outcome"] == "UNKNOWN":
+                    ET.SubElement(
+                        case, "skipped", message="time or memory limit hit"
+                    )
+
+            if r["status"] != 0 and not unknown(r) and not any(
+                c["matches"] is False for c in r["commands"]
+            ):
+                # e.g. Alloy itself failed; make sure it is not reported as
+                # a pass
+                case = ET.SubElement(
+                    suite,
+                    "testcase",
+                    classname=classname,
+                    name="alloy",
+                    time=f"{r['time']:.3f}",
+                )
+                ET.SubElement(
+                    case, "failure", message=f"Alloy exited with code {r['status']}"
+                )
+
+        suite.set("tests", str(len(suite)))
+        suite.set("failures", str(len(suite.findall("testcase/failure"))))
+        suite.set("errors", str(len(suite.findall("testcase/error"))))
+        suite.set("skipped", str(len(suite.findall("testcase/skipped"))))
+
+    ET.ElementTree(suites).write(f, encoding="unicode", xml_declaration=True)
+    f.write("\n")
+
+
+################################################################################
+# Merging the reports of a sharded run
+################################################################################
+
+
+def merge(reports):
+    """
+    Combine the JSON reports (as loaded) of the shards of one run.  Returns
+    the results, ordered by file and instance, and a list of problems: shards
+    missing, repeated or from different runs, and instances missing or run
+    more than once.
+    """
+    problems = []
+    shards = [r["shard"] for r in reports if "shard" in r]
+    if len(shards) < len(reports):
+        problems.append(
+            f"{len(reports) - len(shards)} report(s) are not from a shard"
+        )
+
+    # Every shard enumerates every instance, so each records the full set
+    instances = {}
+    counts = {s["count"] for s in shards}
+    if len(counts) > 1:
+        problems.append(f"reports come from runs split {sorted(counts)} ways")
+    if shards:
+        instances = shards[0]["instances"]
+        if any(s["instances"] != instances for s in shards):
+            problems.append("shards disagree on the tests in the run")
+        indices = [s["index"] for s in shards]
+        n = max(counts)
+        for i in range(1, n + 1):
+            if indices.count(i) == 0:
+                problems.append(f"shard {i}/{n} is missing")
+            elif indices.count(i) > 1:
+                problems.append(f"shard {i}/{n} appears {indices.count(i)} times")
+
+    results = {}
+    for report in reports:
+        for r in report["tests"]:
+            key = (r["file"], r["instance"])
+            if key in results:
+                problems.append(
+                    f"{r['file']} #{r['instance'] + 1} was run more than once"
+                )
+            results[key] = r
+
+    for filename, count in instances.items():
+        missing = [n for n in range(count) if (filename, n) not in results]
+        if missing:
+            problems.append(
+                f"{filename}: {len(missing)} of {count} instance(s) missing, "
+                f"starting with #{missing[0] + 1}"
+            )
+    return [results[k] for k in sorted(results)], problems
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+
+
+################################################################################
+# On-disk cache of Alloy results, keyed by the content of what was solved
+################################################################################
+
+# Bump whenever the stored format or the meaning of a key changes
+_version = 3
+
+_enabled = True
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+def enabled():
+    return _enabled
+
+
+_directory = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "nvlitmus",
+)
+
+
+def set_directory(directory):
+    global _directory, _size
+    _directory = directory
+    _size = None
+
+
+_max_size = 256 * 1024 * 1024
+
+
+def set_max_size(max_size):
+    global _max_size
+    _max_size = max_size
+
+
+_lock = threading.Lock()
+
+# Running total of the bytes stored in _directory, or None if not yet known
+_size = None
+
+# path -> (mtime, digest) for model files already hashed
+_model_digests = {}
+
+
+def _model_digest(model):
+    mtime = os.stat(model).st_mtime_ns
+    try:
+        cached_mtime, digest = _model_digests[model]
+        if cached_mtime == mtime:
+            return digest
+    except KeyError:
+        pass
+    with open(model, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _model_digests[model] = (mtime, digest)
+    return digest
+
+
+# The sources that decide what Alloy text a canonical form turns into, and how
+# RunAlloy solves and reports it, so that a change to any of them is never
+# answered with an older result
+_base = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+_sources = [
+    "src/litmus.py",
+    "src/alloy_emitter.py",
+    "src/canonical.py",
+    "alloy/RunAlloy.java",
+]
+_code_digest = None
+
+
+def _code():
+    global _code_digest
+    if _code_digest is None:
+        h = hashlib.sha256()
+        for source in _sources:
+            h.update(source.encode() + b"\n")
+            try:
+                with open(os.path.join(_base, source), "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(b"(missing)")
+        _code_digest = h.hexdigest()
+    return _code_digest
+
+
+def key(model, text, options={}):
+    """
+    The cache key for solving the test whose canonical form (see the canonical
+    module) is `text` against the model file `model` with the given solver
+    options, by this version of the emitter and RunAlloy
+    """
+    h = hashlib.sha256()
+    h.update(f"nvlitmus-cache-{_version}\n".encode())
+    h.update(_code().encode() + b"\n")
+    h.update(_model_digest(model).encode() + b"\n")
+    for k, v in sorted(options.items()):
+        h.update(f"{k}: {v}\n".encode())
+    h.update(b"\n" + text.encode())
+    return h.hexdigest()
+
+
+def _path(key):
+    return os.path.join(_directory, key[:2], key + ".json")
+
+
+def _outcomes(out):
+    "the (command, SAT/UNSAT) pairs reported in RunAlloy output `out`"
+    return re.findall("^([A-Za-z_][A-Za-z0-9_]*): (SAT|UNSAT)", out, re.M)
+
+
+def get(key):
+    "returns (status, output) for a cached result, or None"
+    if not _enabled:
+        return None
+    path = _path(key)
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+        # Mark as recently used for LRU eviction
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return entry["status"], entry["output"]
+
+
+def put(key, status, out):
+    # Only definite answers are cached: 0 (all as expected) or 10 (some
+    # expectation broken)
+    if not _enabled or status not in [0, 10]:
+        return
+    entry = {
+        "status": status,
+        "commands": _outcomes(out),
+        "output": out,
+    }
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        size = os.path.getsize(tmp)
+        # An entry replaced by this one no longer counts towards the size
+        with _lock:
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp, path)
+    except OSError:
+        return
+    _account(size)
+
+
+def _entries():
+    for root, _, files in os.walk(_directory):
+        for name in files:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+
+def _account(size):
+    global _size
+    with _lock:
+        if _size is None:
+            _size = sum(s for _, s, _ in _entries())
+        else:
+            _size += size
+        if _size > _max_size:
+            _evict()
+
+
+def _evict():
+    "drop least recently used entries until the cache is 3/4 of its maximum"
+    global _size
+    entries = sorted(_entries())
+    _size = sum(s for _, s, _ in entries)
+    for _, size, path in entries:
+        if _size <= _max_size * 3 // 4:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _size -= size
+
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import itertools
+
+
+################################################################################
+# Test templates
+################################################################################
+#
+# A template is a test in which `$0`, `$1`, ... stand for parameters, followed
+# by a line starting with `$$` and then the parameter lists.  The `$$` line
+# says where the lists come from:
+#
+#   $$                  one list per following line, with the parameters
+#                       separated by `|`
+#   $$ file <path>      the same, but read from <path> (relative to the
+#                       test's directory) as the instances are run
+#   $$ product          every combination of the choices on the following
+#                       lines, each of the form `$<i>: <choice> | <choice> ...`
+#
+# In every case blank lines and lines starting with `#` are ignored.  The
+# instances are generated lazily, so that a sweep never holds more than the
+# instances in flight in memory.
+
+
+class TemplateException(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def _lines(lines):
+    "the parameter lines among `lines`, skipping blanks and comments"
+    for ln in lines:
+        ln = ln.rstrip("\n")
+        if ln.strip() and ln[0] != "#":
+            yield ln
+
+
+class Template:
+    def __init__(self, text, directory="."):
+        match = re.search(r"^\$\$(.*)$", text, re.M)
+        if not match:
+            raise TemplateException("a template needs a line starting with $$")
+        body, rest = text[: match.start()], text[match.end() + 1 :]
+
+        # Split the test once, so that each instance is a single join:
+        # literal text at even indices and parameter numbers at odd ones
+        self.pieces = re.split(r"\$([0-9]+)", body)
+        for i in range(1, len(self.pieces), 2):
+            self.pieces[i] = int(self.pieces[i])
+
+        directive = match.group(1).split(None, 1)
+        # The file the parameter lists are read from, if any
+        self.parameter_file = None
+        self._slots = None
+        if not directive:
+            self._inline = rest.split("\n")
+        elif directive[0] == "file" and len(directive) == 2:
+            self.parameter_file = os.path.join(directory, directive[1].strip())
+        elif directive[0] == "product" and len(directive) == 1:
+            self._slots = {}
+            for ln in _lines(rest.split("\n")):
+                slot = re.match(r"^\s*\$([0-9]+)\s*:(.*)$", ln)
+                if not slot:
+                    raise TemplateException(
+                        f"'{ln}': expected $<i>: <choice> | <choice> ..."
+                    )
+                choices = [c.strip() for c in slot.group(2).split("|")]
+                self._slots[int(slot.group(1))] = choices
+            if sorted(self._slots) != list(range(len(self._slots))):
+                raise TemplateException("$$ product must give $0, $1, ... in full")
+        else:
+            raise TemplateException(f"'{match.group(0)}': unknown parameter source")
+
+    def _parameter_lines(self):
+        if self.parameter_file is not None:
+            with open(self.parameter_file, "r") as f:
+                yield from _lines(f)
+        elif self._slots is not None:
+            slots = [self._slots[i] for i in range(len(self._slots))]
+            for choice in itertools.product(*slots):
+                yield " | ".join(choice)
+        else:
+            yield from _lines(self._inline)
+
+    def __len__(self):
+        if self._slots is not None:
+            n = 1
+            for choices in self._slots.values():
+                n *= len(choices)
+            return n
+        return sum(1 for _ in self._parameter_lines())
+
+    def __iter__(self):
+        "yield (parameter list, instance text) for each instance"
+        for parameter_list in self._parameter_lines():
+            yield parameter_list, self.instantiate(parameter_list.split("|"))
+
+    def instantiate(self, parameters):
+        "the test with `$i` replaced by parameters[i], for each i given"
+        pieces = self.pieces
+        text = [pieces[0]]
+        for i in range(1, len(pieces), 2):
+            n = pieces[i]
+            text.append(parameters[n].strip() if n < len(parameters) else f"${n}")
+            text.append(pieces[i + 1])
+        return "".join(text)
+
+
+def is_template(text):
+    return re.search(r"^\$\$", text, re.M) is not None
+
+
+def expand(text, directory="."):
+    """
+    The instances of `text`: an iterable of (parameters, instance text)
+    pairs, with parameters None for a plain test, and with a len()
+    """
+    if not is_template(text):
+        return [(None, text)]
+    return Template(text, directory)
@@ -3,53 +3,213 @@
 import sys
 import argparse
 import output
-import subprocess
+import alloy_server
+import alloy_emitter
+import result_cache
+import canonical
+import native_engine
 import os
 import re
-from litmus_parser import parse
+import time
+import timing
+import template
+import collections
+import itertools
+import threading
+import concurrent.futures
+from litmus_parser import parse, TemplateTest
 
 
 basepath = os.path.dirname(__file__) + "/.."
 
 
-def litmus_to_alloy(model, input_file):
+def model_name(model):
+    "the Alloy module name under which the model file `model` is opened"
+    return os.path.splitext(os.path.basename(model))[0]
+
+
+def parse_litmus(model, input_file, profile=None, parsed=None):
+    """
+    Parse `input_file`, or, if given, call `parsed` for the LitmusTest it has
+    already been parsed into (e.g. a template instance; see TemplateTest)
+    """
     output.verbose("Original test:\n")
-    test = parse(model, input_file)
+    start = time.perf_counter()
+    test = parsed() if parsed else parse(model_name(model), input_file)
+    if profile is not None:
+        profile["parse"] = time.perf_counter() - start
     output.verbose(test)
+    return test
+
+
+def litmus_to_alloy(model, input_file, profile=None, outcomes=False):
+    test = parse_litmus(model, input_file, profile)
+    return emit_alloy(test, profile, outcomes), test
+
 
+def emit_alloy(test, profile=None, outcomes=False):
     output.verbose("Alloy translation:\n")
-    alloy = test.to_alloy()
+    start = time.perf_counter()
+    alloy = test.to_alloy(outcomes=outcomes)
+    if profile is not None:
+        profile["emit"] = time.perf_counter() - start
     output.verbose(alloy)
+    return alloy
+
+
+def _solve(model, text, profile, commands, emit=None):
+    """
+    Run `text` through the Alloy server pool, or, if `emit` is given, the
+    Alloy text that `emit(f)` writes to the file-like `f`.  If the test runs
+    out of time, each of the `commands` it runs is reported as UNKNOWN.
+    """
+    headers = {"model": os.path.abspath(model)}
+    try:
+        if emit:
+            returncode, out, stats = alloy_server.run_stream(emit, headers)
+        else:
+            returncode, out, stats = alloy_server.run(text, headers)
+        profile["alloy_parse"] = sum(
+            s["parse_ms"] / 1000 for s in stats if "parse_ms" in s
+        )
+        profile["commands"] = [s for s in stats if "command" in s]
+    except alloy_server.AlloyTimeout as e:
+        returncode = alloy_server.unknown_status
+        out = "".join(f"{name}: UNKNOWN, test {e}\n" for name in commands)
+    except alloy_server.AlloyServerException as e:
+        sys.stderr.write(f"{e}\n")
+        returncode, out = 1, ""
+    return returncode, out
+
+
+# "alloy", or "native" to decide tests with the native_engine module instead
+_engine = "alloy"
+
+
+def set_engine(engine):
+    global _engine
+    _engine = engine
+
+
+def run_alloy(
+    model,
+    text,
+    out=None,
+    allow_failure=False,
+    engine=None,
+    outcomes=False,
+    parsed=None,
+):
+    """
+    Run a litmus test through Alloy, printing the results.  Returns the
+    RunAlloy status and output, and a profile of where the time went (see
+    the timing module).  `engine` overrides the engine set by set_engine().
+    With `outcomes`, the test's commands are ignored, and every permitted
+    outcome is found instead and printed as a table.  `parsed` is as for
+    parse_litmus().
+    """
+    start = time.perf_counter()
+    profile = new_profile()
+    test = parse_litmus(model, text, profile, parsed)
+    returncode, out = run_parsed(model, test, profile, out, engine, outcomes)
+    profile["wall"] = time.perf_counter() - start
+    return _report(
+        returncode, out, test.commands, allow_failure, profile, outcomes
+    )
+
+
+def new_profile():
+    return {"emit": 0.0, "alloy_parse": 0.0, "cached": False, "commands": []}
 
-    return alloy, test.commands
 
+def run_parsed(model, test, profile, out=None, engine=None, outcomes=False):
+    """
+    Run the parsed LitmusTest `test` as run_alloy() does, filling in
+    `profile`, but return the RunAlloy status and output without reporting
+    them
+    """
+    if (engine or _engine) == "native":
+        output.info("Running the native engine...\n")
+        output.godbolt("\n// Running the native engine...\n")
+        try:
+            return native_engine.run(test, model_name(model), outcomes)
+        except native_engine.NativeEngineException as e:
+            sys.stderr.write(f"{e}\n")
+            return 1, ""
 
-def run_alloy(model, text, out=None, allow_failure=False):
-    text, commands = litmus_to_alloy(model, text)
+    # The commands RunAlloy will report on
+    commands = ["outcomes"] if outcomes else list(test.commands)
+
+    if not out and not result_cache.enabled():
+        # Nothing needs the whole Alloy text, so stream it straight to the
+        # solver as it is emitted
+        def emit(f):
+            test.to_alloy(f, outcomes)
+            output.info("Launching Alloy...\n")
+            output.godbolt("\n// Launching Alloy...\n")
+
+        return _solve(model, None, profile, commands, emit)
+
+    text = emit_alloy(test, profile, outcomes)
 
     if out:
+        with open(model, "r") as f:
+            model_text = f.read()
         with open(out, "w") as f:
-            f.write(text)
+            f.write(alloy_emitter.standalone(model_text, text))
 
     output.info("Launching Alloy...\n")
     output.godbolt("\n// Launching Alloy...\n")
-    proc = subprocess.run(
-        [
-            "java",
-            "-cp",
-            basepath
-            + "/alloy:"
-            + basepath
-            + "/alloy/org.alloytools.alloy.dist.jar",
-            "RunAlloy",
-        ],
-        input=text.encode(),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-
-    out = proc.stdout.decode()
+    # Results are cached under the canonical form of the test, so that tests
+    # differing only in names share them
+    form, command_names, atom_names = canonical.form(test)
+    options = alloy_server.options()
+    if outcomes:
+        options = dict(options, outcomes=True)
+    key = result_cache.key(model, form, options)
+    cached = result_cache.get(key)
+    if cached:
+        returncode, out = cached
+        out = canonical.rename(
+            out, canonical.invert(command_names), canonical.invert(atom_names)
+        )
+        profile["cached"] = True
+    else:
+        returncode, out = _solve(model, text, profile, commands)
+        result_cache.put(
+            key, returncode, canonical.rename(out, command_names, atom_names)
+        )
+    return returncode, out
+
+
+def outcome_table(out):
+    "the outcomes listed in RunAlloy output `out`, as a table of registers"
+    rows = [
+        dict(re.findall(r"([A-Za-z_][A-Za-z0-9_]*)\$0->(-?[0-9]+)", ln))
+        for ln in out.split("\n")
+        if ln.startswith("\toutcome=")
+    ]
+    # Registers are r0, r1, ...: sort them by number
+    registers = sorted(
+        {r for row in rows for r in row}, key=lambda r: (len(r), r)
+    )
+    rows = sorted(tuple(int(row[r]) for r in registers) for row in rows)
+
+    width = max([3] + [len(r) for r in registers])
+    table = " ".join(f"{r:>{width}}" for r in registers) + "\n"
+    for row in rows:
+        table += " ".join(f"{v:>{width}}" for v in row) + "\n"
+    table += f"{len(rows)} permitted outcome(s)\n"
+    return table
+
+
+def _report(returncode, out, commands, allow_failure, profile, outcomes=False):
+    "print RunAlloy's output, mapping each result back to its source line"
     output.info(out)
+    if outcomes and returncode != alloy_server.unknown_status:
+        table = outcome_table(out)
+        output.info(table)
+        output.godbolt(table)
 
     line = None
     for ln in out.split("\n"):
@@ -76,14 +236,185 @@ def run_alloy(model, text, out=None, allow_failure=False):
         else:
             output.godbolt(ln)
 
-    sys.stderr.write(proc.stderr.decode())
-
-    if proc.returncode != 0:
-        sys.stderr.write(f"Alloy exited with code {proc.returncode}\n")
+    if returncode == alloy_server.unknown_status:
+        # Not a failure: the next test should still be run
+        output.always(
+            "// Some results are UNKNOWN: a time or memory limit was hit\n"
+        )
+    elif returncode != 0:
+        sys.stderr.write(f"Alloy exited with code {returncode}\n")
         output.always("// Alloy exited with non-zero return code\n")
         if not allow_failure:
             sys.exit(1)
 
+    return returncode, out, profile
+
+
+# Friendly names for the SAT solvers bundled with Alloy
+solvers = {
+    "sat4j": "sat4j",
+    "minisat": "minisat(jni)",
+    "minisat.prover": "minisat.prover(jni)",
+    "glucose": "glucose(jni)",
+    "cryptominisat": "cryptominisat(jni)",
+    "lingeling": "lingeling(jni)",
+    "plingeling": "plingeling(jni)",
+}
+
+
+def solver_id(name):
+    "the RunAlloy solver id for `name`; anything unrecognized is passed as is"
+    return solvers.get(name, name)
+
+
+def add_solver_arguments(arg_parser):
+    "arguments shared by every front end that runs tests through Alloy"
+    arg_parser.add_argument(
+        "-m",
+        dest="model",
+        default=basepath + "/alloy/ptx.als",
+        help="Alloy model",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=1,
+        type=int,
+        help="Run up to N tests or template instances in parallel",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="Always run Alloy, ignoring and not updating the result cache",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        help="Result cache directory (default ~/.cache/nvlitmus)",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        default=256,
+        type=int,
+        help="Maximum result cache size in MiB",
+    )
+    arg_parser.add_argument(
+        "--solver",
+        dest="solver",
+        default=None,
+        type=solver_id,
+        help=f"SAT solver: one of {', '.join(solvers)}, or "
+        "'external:<binary> [args]' for a DIMACS solver (default sat4j)",
+    )
+    arg_parser.add_argument(
+        "--engine",
+        dest="engine",
+        default="alloy",
+        choices=["alloy", "native"],
+        help="Decide tests with Alloy, or by enumerating executions natively "
+        "(small tests only; requires numpy)",
+    )
+    arg_parser.add_argument(
+        "--symmetry",
+        dest="symmetry",
+        default=None,
+        type=int,
+        help="Symmetry-breaking level (0 disables symmetry breaking)",
+    )
+    arg_parser.add_argument(
+        "--skolem-depth",
+        dest="skolem_depth",
+        default=None,
+        type=int,
+        help="Maximum skolemization depth",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Report where time goes for each test, and the slowest commands",
+    )
+    arg_parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        default=None,
+        type=float,
+        help="Give up on any test that Alloy takes more than this many "
+        "seconds over, reporting its commands as UNKNOWN",
+    )
+    arg_parser.add_argument(
+        "--command-timeout",
+        dest="command_timeout",
+        default=None,
+        type=float,
+        help="Give up on any Alloy command that takes more than this many "
+        "seconds, reporting it as UNKNOWN",
+    )
+    arg_parser.add_argument(
+        "--solver-memory",
+        dest="solver_memory",
+        default=None,
+        help="Maximum Java heap of each Alloy process (e.g. 4g); commands "
+        "that run out are reported as UNKNOWN",
+    )
+    arg_parser.add_argument(
+        "--java-library-path",
+        dest="java_library_path",
+        default=None,
+        help="Directory holding the native libraries for the JNI solvers",
+    )
+
+
+def apply_solver_arguments(args):
+    alloy_server.set_jobs(args.jobs)
+    timing.set_enabled(args.profile)
+    set_engine(args.engine)
+    alloy_server.set_options(args.solver, args.symmetry, args.skolem_depth)
+    alloy_server.set_limits(args.timeout, args.command_timeout)
+    java_options = []
+    if args.java_library_path:
+        java_options.append(f"-Djava.library.path={args.java_library_path}")
+    if args.solver_memory:
+        java_options.append(f"-Xmx{args.solver_memory}")
+    alloy_server.set_java_options(java_options)
+
+    result_cache.set_enabled(args.cache)
+    if args.cache_dir:
+        result_cache.set_directory(args.cache_dir)
+    result_cache.set_max_size(args.cache_size * 1024 * 1024)
+
+
+def expand(input_file, directory="."):
+    """
+    Split a test into its template instances: an iterable of (parameters,
+    instance text) pairs, with parameters None for a plain test.  Instances
+    are generated as they are consumed (see the template module).
+    """
+    return template.expand(input_file, directory)
+
+
+def map_bounded(executor, fn, items, window):
+    """
+    Like executor.map(fn, items), but submitting at most `window` calls
+    ahead of the results consumed, so that `items` may be an unbounded
+    generator
+    """
+    futures = collections.deque()
+    for item in items:
+        futures.append(executor.submit(fn, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+warning_string = """// NVLitmus is a research prototype, and comes with no guarantees of completeness, correctness, or authoritativeness.  Please see https://github.com/NVlabs/mixedproxy for more information.
+"""
+
 
 def main(argv=sys.argv[1:], input_string=None):
     arg_parser = argparse.ArgumentParser(
@@ -109,12 +440,6 @@ def main(argv=sys.argv[1:], input_string=None):
         default="",
         help="save alloy model to specified file",
     )
-    arg_parser.add_argument(
-        "-m",
-        dest="model",
-        default=basepath + "/alloy/ptx.als",
-        help="Alloy model",
-    )
     arg_parser.add_argument(
         "-g", dest="godbolt", action="store_true", help="Godbolt mode"
     )
@@ -128,6 +453,21 @@ def main(argv=sys.argv[1:], input_string=None):
         type=int,
         help="For templates, skip the first N tests",
     )
+    arg_parser.add_argument(
+        "--outcomes",
+        dest="outcomes",
+        action="store_true",
+        help="Ignore the test's commands, and print a table of every "
+        "permitted outcome (final register values) instead",
+    )
+    arg_parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep running, and re-run the test whenever it or the model "
+        "changes, solving only the commands that changed",
+    )
+    add_solver_arguments(arg_parser)
     arg_parser.add_argument(
         "-v", dest="verbose", action="store_true", help="verbose"
     )
@@ -144,6 +484,8 @@ def main(argv=sys.argv[1:], input_string=None):
     if args.verbose:
         output.set_verbose(True)
 
+    apply_solver_arguments(args)
+
     if args.output:
         output.set_output(open(args.output, "w"))
 
@@ -153,13 +495,17 @@ def main(argv=sys.argv[1:], input_string=None):
     if args.quiet:
         output.set_info(False)
 
-    warning_string = """// NVLitmus is a research prototype, and comes with no guarantees of completeness, correctness, or authoritativeness.  Please see https://github.com/NVlabs/mixedproxy for more information.
-"""
     output.info(warning_string)
     output.godbolt(warning_string)
 
-    with open(args.model, "r") as f:
-        model = f.read()
+    name = args.input or "<stdin>"
+
+    if args.watch:
+        if not args.input:
+            sys.stderr.write("--watch needs an input file\n")
+            sys.exit(1)
+        watch(args)
+        return
 
     if args.input:
         with open(args.input, "r") as f:
@@ -169,30 +515,259 @@ def main(argv=sys.argv[1:], input_string=None):
     else:
         input_file = sys.stdin.read()
 
-    if "$$" in input_file:
-        n = 0
-        test, parameter_lists = input_file.split("$$\n")
-        instances = [
-            i for i in parameter_lists.split("\n") if i.strip() and i[0] != "#"
-        ]
-        output.info(f"{len(instances)} instances\n\n")
-        for parameter_list in instances:
-            if n < args.skip:
-                n += 1
-                continue
+    try:
+        run_input(args, name, input_file)
+    except (template.TemplateException, OSError) as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
+
+    if timing.enabled():
+        output.always(timing.suite_summary())
+
+
+def run_input(args, name, input_file, run=run_alloy):
+    """
+    Run the test or template `input_file` as main() does, each instance
+    through `run` (run_alloy, or a function taking the same arguments)
+    """
+    model = args.model
+    if not template.is_template(input_file):
+        output.info(f"Test:\n{input_file}\n")
+        _, _, profile = run(
+            model, input_file, args.alloy, args.godbolt, outcomes=args.outcomes
+        )
+        timing.record(name, profile)
+        if timing.enabled():
+            output.info(timing.test_summary(profile))
+        return
+
+    instances = expand(
+        input_file, os.path.dirname(args.input) if args.input else "."
+    )
+    total = len(instances)
+    output.info(f"{total} instances\n\n")
+
+    # Parse the template once, and each instance only where it differs
+    parsed = TemplateTest(model_name(model), instances)
+
+    def run_instance(n, parameters, instance):
+        buffer = output.capture()
+        try:
             # sys.stdout.write(f'Instance {n}: {parameter_list.strip()}\n')
-            instance = test
-            for i, parameter in enumerate(parameter_list.split("|")):
-                instance = instance.replace(f"${i}", parameter.strip())
             output.info(f"Litmus test instance is:\n{instance}")
-            output.info(f"\n\nInstance {n+1}/{len(instances)}:\n{instance}\n")
-            run_alloy(model, instance, args.alloy, args.godbolt)
+            output.info(
+                f"\n\nInstance {n+1}/{total}:\n{instance}\n"
+            )
+            _, _, profile = run(
+                model,
+                instance,
+                args.alloy,
+                args.godbolt,
+                outcomes=args.outcomes,
+                parsed=lambda: parsed.instantiate(parameters.split("|")),
+            )
+            timing.record(f"{name} #{n+1}", profile)
+            if timing.enabled():
+                output.info(timing.test_summary(profile))
             output.info("\n")
-            n += 1
-        output.info("Done!\n")
-    else:
-        output.info(f"Test:\n{input_file}\n")
-        run_alloy(model, input_file, args.alloy, args.godbolt)
+            return buffer.getvalue(), None
+        except BaseException as e:
+            return buffer.getvalue(), e
+        finally:
+            output.release()
+
+    # Instances run concurrently but their output is replayed in order
+    pending = itertools.islice(
+        ((n, p, i) for n, (p, i) in enumerate(instances)), args.skip, None
+    )
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        if args.jobs > 1:
+            results = map_bounded(
+                executor, lambda i: run_instance(*i), pending, 2 * args.jobs
+            )
+        else:
+            results = map(lambda i: run_instance(*i), pending)
+        for text, e in results:
+            output.always(text)
+            if e is not None:
+                executor.shutdown(cancel_futures=True)
+                raise e
+    output.info("Done!\n")
+
+
+################################################################################
+# Watch mode
+################################################################################
+
+
+def _command_blocks(out):
+    """
+    Split RunAlloy output into the lines reported for each command, with
+    those of sanity_X under X, and any before the first command under None
+    """
+    blocks = {}
+    name = None
+    for ln in out.split("\n"):
+        if not ln:
+            continue
+        match = re.search("^([A-Za-z_][A-Za-z0-9_]*): ", ln)
+        if match:
+            name = match.group(1)
+            if len(name) > 7 and name[:7] == "sanity_":
+                name = name[7:]
+        blocks.setdefault(name, []).append(ln)
+    return blocks
+
+
+class Incremental:
+    """
+    Runs tests as run_alloy() does, but remembers what was reported for each
+    command of each test body (the test without its commands, in canonical
+    form), and only solves the commands not yet seen with the same body.
+    Everything is forgotten when the model changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = {}
+
+    def forget(self):
+        with self._lock:
+            self._known = {}
+
+    # Reported lines are remembered with the command, op and register names
+    # of the canonical form, as run_parsed() caches them, so that they can be
+    # reused after those names are edited
+
+    @staticmethod
+    def _text(lines):
+        return "".join(f"{ln}\n" for ln in lines)
+
+    @staticmethod
+    def _store(lines, commands, atoms):
+        return canonical.rename(Incremental._text(lines), commands, atoms)
+
+    @staticmethod
+    def _load(text, commands, atoms):
+        return canonical.rename(
+            text, canonical.invert(commands), canonical.invert(atoms)
+        )
+
+    def run(
+        self,
+        model,
+        text,
+        out=None,
+        allow_failure=False,
+        engine=None,
+        outcomes=False,
+        parsed=None,
+    ):
+        if out or outcomes:
+            return run_alloy(model, text, out, True, engine, outcomes, parsed)
+
+        start = time.perf_counter()
+        profile = new_profile()
+        test = parse_litmus(model, text, profile, parsed)
+        commands = test.commands
+        test.commands = {}
+        form, _, atoms = canonical.form(test)
+        body = (engine or _engine, form)
+        keys = {n: canonical.command(c, atoms) for n, c in commands.items()}
+        names = {
+            n: {n: "check_c" if n.startswith("check_") else "c"}
+            for n in commands
+        }
+        with self._lock:
+            known = self._known.setdefault(body, {})
+            stale = {n: c for n, c in commands.items() if keys[n] not in known}
+            solve = stale or "sanity" not in known
+
+        blocks = {}
+        returncode = 0
+        if solve:
+            test.commands = stale
+            returncode, out = run_parsed(model, test, profile, engine=engine)
+            test.commands = commands
+            blocks = _command_blocks(out)
+            if returncode in [0, 10]:
+                with self._lock:
+                    known["sanity"] = self._store(
+                        blocks.get("sanity", []), {}, atoms
+                    )
+                    for n in stale:
+                        known[keys[n]] = self._store(
+                            blocks.get(n, []), names[n], atoms
+                        )
+        else:
+            output.info("No commands changed\n")
+            profile["cached"] = True
+
+        # Put the output back together in the order RunAlloy prints it
+        with self._lock:
+            out = self._text(blocks.get(None, []))
+            out += self._load(known.get("sanity", ""), {}, atoms)
+            for n in commands:
+                if n in stale:
+                    out += self._text(blocks.get(n, []))
+                else:
+                    out += self._load(known[keys[n]], names[n], atoms)
+        if returncode in [0, 10]:
+            returncode = 10 if "breaks expectation" in out else 0
+
+        profile["wall"] = time.perf_counter() - start
+        return _report(returncode, out, commands, True, profile)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def watch(args, interval=0.5):
+    """
+    Run args.input, then run it again whenever it, its parameter file or the
+    model changes, until interrupted.  The parser and the Alloy servers
+    stay warm in between, and only the commands that changed are solved
+    again (see Incremental).
+    """
+    incremental = Incremental()
+    mtimes = {}
+    extra = []
+    try:
+        while True:
+            paths = [args.model, args.input] + extra
+            changed = [p for p in paths if _mtime(p) != mtimes.get(p, -1)]
+            if not changed:
+                time.sleep(interval)
+                continue
+            for p in changed:
+                mtimes[p] = _mtime(p)
+            if args.model in changed:
+                incremental.forget()
+
+            output.always(
+                f"\n// {time.strftime('%H:%M:%S')}: running {args.input}\n"
+            )
+            try:
+                with open(args.input, "r") as f:
+                    input_file = f.read()
+                extra = []
+                if template.is_template(input_file):
+                    t = template.Template(
+                        input_file, os.path.dirname(args.input)
+                    )
+                    extra = [t.parameter_file] if t.parameter_file else []
+                run_input(args, args.input, input_file, incremental.run)
+            except Exception as e:
+                sys.stderr.write(f"{e}\n")
+            if timing.enabled():
+                output.always(timing.suite_summary())
+            output.always(f"// Watching {', '.join(paths)} for changes...\n")
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import threading
+
+
+################################################################################
+# Per-command timing and solver statistics
+################################################################################
+
+# Each profile is a dict as built by test_to_alloy.run_alloy:
+#   parse, emit: seconds spent in the Python parser and the Alloy emitter
+#   alloy_parse: seconds RunAlloy spent parsing and typechecking
+#   wall: total seconds for the test, including waiting for a solver
+#   cached: whether the result came from the result cache
+#   commands: RunAlloy's statistics for each command (see RunAlloy.runModel)
+
+_enabled = False
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+def enabled():
+    return _enabled
+
+
+_lock = threading.Lock()
+_profiles = []
+
+
+def record(label, profile):
+    "remember the profile of test `label` for the suite summary"
+    if _enabled:
+        with _lock:
+            _profiles.append((label, profile))
+
+
+def totals(profiles):
+    "sum the phases of a list of profiles"
+    t = {
+        "parse": 0.0,
+        "emit": 0.0,
+        "alloy_parse": 0.0,
+        "translate": 0.0,
+        "solve": 0.0,
+        "wall": 0.0,
+    }
+    for p in profiles:
+        for k in ["parse", "emit", "alloy_parse", "wall"]:
+            t[k] += p[k]
+        for c in p["commands"]:
+            t["translate"] += c["translate_ms"] / 1000
+            t["solve"] += c["solve_ms"] / 1000
+    return t
+
+
+def _phases(t):
+    return (
+        f"parse {t['parse']:.3f}s, emit {t['emit']:.3f}s, "
+        f"Alloy parse {t['alloy_parse']:.3f}s, translate {t['translate']:.3f}s, "
+        f"solve {t['solve']:.3f}s, wall {t['wall']:.3f}s"
+    )
+
+
+def test_summary(profile):
+    "one test's profile, one line per phase and per command"
+    if profile["cached"]:
+        return f"// Profile: cached result, wall {profile['wall']:.3f}s\n"
+    s = f"// Profile: {_phases(totals([profile]))}\n"
+    for c in profile["commands"]:
+        s += f"//   {_command(c)}\n"
+    return s
+
+
+def _command(c):
+    if c.get("implied"):
+        return f"{c['command']:<24} SAT   implied by another command's result"
+    return (
+        f"{c['command']:<24} {'SAT' if c['sat'] else 'UNSAT':<5} "
+        f"translate {c['translate_ms']:>9.1f}ms  solve {c['solve_ms']:>9.1f}ms  "
+        f"{c['primary_vars']:>7} primary vars  {c['clauses']:>8} clauses"
+    )
+
+
+def suite_summary(n=10):
+    "totals over every recorded profile, plus the `n` slowest commands"
+    with _lock:
+        profiles = list(_profiles)
+
+    s = f"\n// Profile of {len(profiles)} tests "
+    s += f"({len([p for _, p in profiles if p['cached']])} cached):\n"
+    s += f"//   {_phases(totals([p for _, p in profiles]))}\n"
+
+    commands = [(label, c) for label, p in profiles for c in p["commands"]]
+    commands.sort(key=lambda i: -i[1]["total_ms"])
+    if commands:
+        s += f"// Slowest commands:\n"
+        for label, c in commands[:n]:
+            s += f"//   {label}: {_command(c)}\n"
+    return s
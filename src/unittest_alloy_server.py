@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import alloy_server
+
+
+################################################################################
+# Sharing servers between threads
+################################################################################
+
+
+class _Server:
+    "stands in for an AlloyServer, retiring or failing on request"
+
+    started = 0
+    # Held until every thread has asked for a server
+    gate = threading.Event()
+
+    def __init__(self):
+        _Server.started += 1
+        self.retired = False
+        self.closed = False
+
+    def run(self, text, headers={}, timeout=None):
+        _Server.gate.wait()
+        if text == "fail":
+            raise alloy_server.AlloyServerException("failed")
+        self.retired = text == "retire"
+        return 0, text
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTests(unittest.TestCase):
+    def setUp(self):
+        _Server.started = 0
+        _Server.gate.clear()
+        patcher = mock.patch.object(alloy_server, "AlloyServer", _Server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_threads(self, pool, texts):
+        "run `texts` on `pool` from one thread each, returning the results"
+        results = {}
+        errors = []
+
+        def run(text):
+            try:
+                results[text] = pool.run(text)
+            except alloy_server.AlloyServerException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(t,), daemon=True) for t in texts]
+        for t in threads:
+            t.start()
+        time.sleep(0.2)
+        _Server.gate.set()
+        for t in threads:
+            t.join(10)
+            self.assertFalse(t.is_alive(), "a thread waiting for a server hung")
+        return results, errors
+
+    def test_reuse(self):
+        _Server.gate.set()
+        pool = alloy_server.AlloyPool(2)
+        for text in ["a", "b", "c"]:
+            self.assertEqual(pool.run(text), (0, text))
+        self.assertEqual(_Server.started, 1)
+
+    def test_retired_wakes_waiters(self):
+        pool = alloy_server.AlloyPool(1)
+        texts = ["retire"] + [f"t{n}" for n in range(8)]
+        results, errors = self.run_threads(pool, texts)
+        self.assertEqual(len(results), len(texts))
+        self.assertEqual(errors, [])
+
+    def test_failure_wakes_waiters(self):
+        pool = alloy_server.AlloyPool(2)
+        texts = ["fail", "fail"] + [f"t{n}" for n in range(8)]
+        results, errors = self.run_threads(pool, texts)
+        self.assertEqual(len(results), len(texts) - 2)
+        self.assertEqual(len(errors), 2)
+
+    def test_never_more_than_size(self):
+        pool = alloy_server.AlloyPool(3)
+        self.run_threads(pool, [f"t{n}" for n in range(20)])
+        self.assertLessEqual(len(pool._servers), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
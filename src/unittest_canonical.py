@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import canonical
+from litmus_parser import parse
+
+
+################################################################################
+# Canonical forms
+################################################################################
+
+_test = """.global x;
+.global flag;
+d0.b0.t0 {
+  st.weak [x], 1;
+  st.release.gpu [flag], 1;
+}
+d0.b1.t0 {
+  ld.acquire.gpu r0, [flag];
+  ld.weak r1, [x];
+}
+permit (r0 == 1 && r1 == 0) as mp;
+"""
+
+# The same test, with its threads in the other order and every name changed
+_renamed = """.global y;
+.global ready;
+d1.b3.t2 {
+  ld.acquire.gpu r7, [ready];
+  ld.weak r4, [y];
+}
+d1.b0.t5 {
+  st.weak [y], 1;
+  st.release.gpu [ready], 1;
+}
+permit (r7 == 1 && r4 == 0) as other;
+"""
+
+
+def _form(text):
+    return canonical.form(parse("ptx", text))
+
+
+class FormTests(unittest.TestCase):
+    def test_renaming(self):
+        self.assertEqual(_form(_test)[0], _form(_renamed)[0])
+
+    def test_registers(self):
+        text = _test.replace("r0", "r5").replace("r1", "r0").replace("r5", "r1")
+        self.assertEqual(_form(_test)[0], _form(text)[0])
+
+    def test_differences(self):
+        for a, b in [
+            ("st.weak [x], 1;", "st.weak [x], 2;"),
+            ("ld.weak r1, [x];", "ld.weak r1, [flag];"),
+            ("d0.b1.t0", "d0.b0.t1"),
+            ("d0.b1.t0", "d1.b0.t0"),
+            ("permit", "assert"),
+            ("r1 == 0", "r1 == 1"),
+        ]:
+            self.assertNotEqual(
+                _form(_test)[0], _form(_test.replace(a, b))[0], (a, b)
+            )
+
+    def test_names(self):
+        _, commands, atoms = _form(_test)
+        _, renamed_commands, renamed_atoms = _form(_renamed)
+        self.assertEqual(commands, {"mp": "c0"})
+        self.assertEqual(renamed_commands, {"other": "c0"})
+        # Registers that play the same part get the same canonical name
+        self.assertEqual(atoms["r0"], renamed_atoms["r7"])
+        self.assertEqual(atoms["r1"], renamed_atoms["r4"])
+
+
+################################################################################
+# Renaming output
+################################################################################
+
+_out = """sanity_mp: SAT
+mp: SAT, outcome permitted, matches expectation
+\tvalue={i0$0->r0$0, i3$0->r1$0}
+unrelated: r0$0 stays
+"""
+
+
+class RenameTests(unittest.TestCase):
+    def test_round_trip(self):
+        _, commands, atoms = _form(_test)
+        out = canonical.rename(_out, commands, atoms)
+        self.assertNotEqual(out, _out)
+        self.assertEqual(
+            canonical.rename(
+                out, canonical.invert(commands), canonical.invert(atoms)
+            ),
+            _out,
+        )
+
+    def test_between_tests(self):
+        "output cached for one test is reported in another's names"
+        _, commands, atoms = _form(_test)
+        _, renamed_commands, renamed_atoms = _form(_renamed)
+        out = canonical.rename(
+            canonical.rename(_out, commands, atoms),
+            canonical.invert(renamed_commands),
+            canonical.invert(renamed_atoms),
+        )
+        self.assertIn("sanity_other: SAT\n", out)
+        self.assertIn("other: SAT, outcome permitted", out)
+        self.assertIn("\tvalue={i2$0->r7$0, i1$0->r4$0}\n", out)
+        self.assertIn("unrelated: r0$0 stays", out)
+
+    def test_invert(self):
+        names = {"a": "c0", "b": "c1"}
+        self.assertEqual(canonical.invert(canonical.invert(names)), names)
+
+    def test_command(self):
+        test, renamed = parse("ptx", _test), parse("ptx", _renamed)
+        self.assertEqual(
+            canonical.command(test.commands["mp"], canonical.form(test)[2]),
+            canonical.command(
+                renamed.commands["other"], canonical.form(renamed)[2]
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import itertools
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generator
+import native_engine
+from litmus_parser import parse
+
+
+################################################################################
+# Mnemonics
+################################################################################
+
+
+class MnemonicTests(unittest.TestCase):
+    def test_defaults(self):
+        self.assertEqual(generator._mnemonic("ld"), ("ld", None, "weak", None))
+        self.assertEqual(
+            generator._mnemonic("st.release.gpu"), ("st", None, "release", "gpu")
+        )
+        # Atomics are .relaxed unless they say otherwise, as when parsed
+        self.assertEqual(
+            generator._mnemonic("atom.add.gpu"), ("atom", "add", "relaxed", "gpu")
+        )
+        self.assertEqual(
+            generator._mnemonic("red.add.acq_rel.sys"),
+            ("red", "add", "acq_rel", "sys"),
+        )
+
+    def test_invalid(self):
+        for mnemonic in [
+            "ld.weak.gpu",
+            "ld.relaxed",
+            "atom.add",
+            "atom.add.weak.gpu",
+            "atom.gpu",
+            "fence.acquire.gpu",
+            "mov",
+        ]:
+            with self.assertRaises(generator.GeneratorException, msg=mnemonic):
+                generator.check_vocabulary(["ld", mnemonic])
+
+
+################################################################################
+# Enumeration
+################################################################################
+
+
+class GenerateTests(unittest.TestCase):
+    def test_counts(self):
+        stats = {}
+        unique = list(generator.generate(2, 2, ["ld", "st"], 2, stats))
+        self.assertEqual(stats["unique"], len(unique))
+        self.assertEqual(len(set(unique)), len(unique))
+        self.assertLess(stats["unique"], stats["enumerated"])
+        skeletons = generator.skeletons(2, 2, ["ld", "st"], 2)
+        self.assertEqual(
+            len({generator.canonical(s) for s in skeletons}), len(unique)
+        )
+
+    def test_lazy(self):
+        stats = {}
+        first = list(
+            itertools.islice(
+                generator.generate(4, 8, generator.default_vocabulary, 3, stats), 5
+            )
+        )
+        self.assertEqual(len(first), 5)
+        self.assertLess(stats["enumerated"], 100)
+
+    def test_text_parses(self):
+        vocabulary = ["ld", "st.release.gpu", "atom.add.gpu", "red.add.gpu"]
+        for skeleton in generator.generate(2, 2, vocabulary, 2):
+            test = generator.to_test(skeleton)
+            parsed = parse("ptx", generator.litmus_text(test))
+            self.assertEqual(
+                "".join(map(str, parsed.threads.values())),
+                "".join(map(str, test.threads.values())),
+            )
+
+    @unittest.skipUnless(native_engine.available(), "the native engine needs numpy")
+    def test_atomics_run(self):
+        "atomics with no semantic given can be emitted and solved"
+        vocabulary = ["ld", "atom.add.gpu", "red.add.gpu"]
+        for skeleton in generator.generate(2, 2, vocabulary, 1):
+            text = generator.litmus_text(generator.to_test(skeleton))
+            status, out = native_engine.run(parse("ptx", text), "ptx")
+            self.assertEqual(status, 0, out)
+
+
+if __name__ == "__main__":
+    unittest.main()
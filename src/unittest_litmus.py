@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import template
+import generator
+from litmus import InstructionTable
+from litmus_parser import parse
+
+_tests = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+
+
+def _instances():
+    "every (name, instance text) in the test suite"
+    for f in sorted(os.listdir(_tests)):
+        with open(os.path.join(_tests, f)) as t:
+            contents = t.read()
+        for n, (_, instance) in enumerate(template.expand(contents, _tests)):
+            yield f"{f} #{n + 1}", instance
+
+
+################################################################################
+# Compacted tests
+################################################################################
+
+
+class CompactTests(unittest.TestCase):
+    def check(self, text):
+        test = parse("ptx", text)
+        count = sum(len(t.insts) for t in test.threads.values())
+        self.assertEqual(len(parse("ptx", text).compact().table), count)
+
+        # Each from a fresh parse, since str() rebuilds the Thread nodes that
+        # compact() dropped
+        for outcomes in [False, True]:
+            compact = parse("ptx", text).compact()
+            self.assertEqual(
+                compact.to_alloy(outcomes=outcomes),
+                parse("ptx", text).to_alloy(outcomes=outcomes),
+            )
+        self.assertEqual(str(parse("ptx", text).compact()), str(test))
+
+    def test_suite(self):
+        for name, instance in _instances():
+            with self.subTest(name):
+                self.check(instance)
+
+    def test_generated(self):
+        skeletons = generator.generate(
+            3, 4, ["ld", "st.release.gpu", "atom.add.gpu", "fence.sc.gpu"], 2
+        )
+        for n, skeleton in zip(range(50), skeletons):
+            with self.subTest(n):
+                self.check(generator.litmus_text(generator.to_test(skeleton)))
+
+    def test_threads_rebuilt(self):
+        name, instance = next(_instances())
+        test = parse("ptx", instance)
+        threads = [str(t) for t in test.threads.values()]
+        test.compact()
+        self.assertEqual([str(t) for t in test.threads.values()], threads)
+
+    def test_table_from_threads(self):
+        name, instance = next(_instances())
+        test = parse("ptx", instance)
+        table = InstructionTable(test.threads.values(), test.addresses)
+        self.assertEqual(
+            [str(t) for t in table.to_threads()],
+            [str(t) for t in test.threads.values()],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
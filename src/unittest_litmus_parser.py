@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import template
+from litmus_parser import TemplateTest, parse
+
+
+################################################################################
+# Instances parsed from the template's fragments
+################################################################################
+
+_test = """.global x;
+d0.b0.t0 {
+  $0 [x], 1;
+}
+d0.b1.t0 {
+  ld.weak r0, [x];
+}
+$1 (r0 == 1) as c;
+"""
+
+
+class TemplateTestTests(unittest.TestCase):
+    def check(self, text, parameters):
+        "instantiate() agrees with parsing the instance in full"
+        t = template.Template(text)
+        expected = parse("ptx", t.instantiate(parameters))
+        test = TemplateTest("ptx", t).instantiate(parameters)
+        self.assertEqual(str(test), str(expected))
+        self.assertEqual(
+            [(i.name, i.line) for th in test.threads.values() for i in th.insts],
+            [(i.name, i.line) for th in expected.threads.values() for i in th.insts],
+        )
+        self.assertEqual(
+            [c.line for c in test.commands.values()],
+            [c.line for c in expected.commands.values()],
+        )
+        self.assertEqual(test.to_alloy(), expected.to_alloy())
+        return test
+
+    def test_instances(self):
+        self.check(_test + "$$\n", ["st.weak", "permit"])
+        self.check(_test + "$$\n", ["st.release.gpu", "assert"])
+
+    def test_several_instructions(self):
+        text = _test.replace("$0 [x], 1;", "$0\n  st.weak [x], 2;")
+        self.check(text + "$$\n", ["st.weak [x], 1; fence.sc.gpu;", "permit"])
+
+    def test_empty_slot(self):
+        text = _test.replace("$0 [x], 1;", "st.weak [x], 1;\n  $0")
+        self.check(text + "$$\n", ["", "permit"])
+        self.check(text + "$$\n", ["fence.sc.gpu;", "permit"])
+
+    def test_parameter_in_header(self):
+        text = _test.replace("d0.b1.t0", "d0.$2.t0")
+        self.check(text + "$$\n", ["st.weak", "permit", "b0"])
+        self.check(text + "$$\n", ["st.weak", "permit", "b1"])
+
+    def test_parameter_in_comment(self):
+        text = _test.replace("ld.weak r0, [x];", "ld.weak r0, [x]; // $2")
+        self.check(text + "$$\n", ["st.weak", "permit", "note"])
+
+    def test_parameter_spanning_statements(self):
+        self.check(_test + "$$\n", ["st.weak", "permit (r0 == 0) as d; permit"])
+
+    def test_braces_and_comments_fall_back(self):
+        text = _test.replace("ld.weak r0, [x];", "$2")
+        self.check(text + "$$\n", ["st.weak", "permit", "ld.weak r0, [x]; // {"])
+
+    def test_shared_prefix(self):
+        "instances splice their own threads onto the Alloy of the shared ones"
+        text = _test.replace("$0 [x], 1;", "st.weak [x], 1;")
+        text = text.replace("ld.weak r0, [x];", "$0 r0, [x];")
+        t = TemplateTest("ptx", template.Template(text + "$$\n"))
+        for parameters in [["ld.weak", "permit"], ["ld.relaxed.gpu", "assert"]]:
+            test = self.check(text + "$$\n", parameters)
+            self.assertIsNotNone(test.prefix)
+            test = t.instantiate(parameters)
+            self.assertIs(test.prefix, t.instantiate(parameters).prefix)
+            expected = parse("ptx", t.template.instantiate(parameters))
+            self.assertEqual(test.to_alloy(), expected.to_alloy())
+
+    def test_errors_match(self):
+        t = template.Template(_test + "$$\n")
+        with self.assertRaises(Exception) as expected:
+            parse("ptx", t.instantiate(["st.bogus", "permit"]))
+        with self.assertRaises(Exception) as raised:
+            TemplateTest("ptx", t).instantiate(["st.bogus", "permit"])
+        self.assertEqual(type(raised.exception), type(expected.exception))
+        self.assertEqual(str(raised.exception), str(expected.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
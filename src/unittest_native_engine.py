@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import template
+import native_engine
+from litmus_parser import parse
+
+_tests = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+
+_mp = """.global x;
+.global flag;
+d0.b0.t0 {
+  st.weak [x], 1;
+  st.release.gpu [flag], 1;
+}
+d0.b1.t0 {
+  ld.acquire.gpu r0, [flag];
+  ld.weak r1, [x];
+}
+"""
+
+
+def _run(text, outcomes=False):
+    return native_engine.run(parse("ptx", text), "ptx", outcomes)
+
+
+################################################################################
+# The native engine against the expectations of the suite
+################################################################################
+
+
+@unittest.skipUnless(native_engine.available(), "the native engine needs numpy")
+class NativeEngineTests(unittest.TestCase):
+    def test_suite(self):
+        for name in ["CoWR.test", "SB_rmw.test", "MP_gpu.test", "ISA2.test"]:
+            with open(os.path.join(_tests, name), "r") as f:
+                contents = f.read()
+            for parameters, instance in template.expand(contents, _tests):
+                status, out = _run(instance)
+                self.assertEqual(status, 0, (name, parameters, out))
+                self.assertNotIn("breaks expectation", out)
+
+    def test_broken_expectation(self):
+        status, out = _run(_mp + "permit (r0 == 1 && r1 == 0) as mp;\n")
+        self.assertEqual(status, 10)
+        self.assertIn("mp: UNSAT, outcome not permitted, breaks expectation", out)
+
+        status, out = _run(_mp + "assert (r0 == 0 || r1 == 1) as mp;\n")
+        self.assertEqual(status, 0)
+        self.assertIn("mp: UNSAT, assertion confirmed, matches expectation", out)
+
+        status, out = _run(_mp + "assert (r0 == 1 && r1 == 1) as mp;\n")
+        self.assertEqual(status, 10)
+        self.assertIn("mp: SAT, assertion violated, breaks expectation", out)
+        self.assertIn("\tvalue={", out)
+
+    def test_outcomes(self):
+        status, out = _run(_mp, outcomes=True)
+        self.assertEqual(status, 0)
+        found = {ln.strip() for ln in out.split("\n") if "outcome=" in ln}
+        self.assertEqual(
+            found,
+            {
+                "outcome={r0$0->0, r1$0->0}",
+                "outcome={r0$0->0, r1$0->1}",
+                "outcome={r0$0->1, r1$0->1}",
+            },
+        )
+        self.assertTrue(out.startswith("outcomes: 3 permitted\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import report
+from nvlitmus import shard
+
+
+################################################################################
+# Merging the reports of a sharded run
+################################################################################
+
+# Two files, with three instances and one
+_pending = [("ptx", "a.test", n, None, "") for n in range(3)] + [
+    ("ptx", "b.test", 0, None, "")
+]
+
+
+def _report(index, count):
+    "the JSON report (as loaded) of shard `index` of `count`"
+    instances = {}
+    tests = [
+        {"file": filename, "instance": n, "error": None, "status": 0}
+        for _, filename, n, _, _ in shard(_pending, index, count, instances)
+    ]
+    info = {"index": index, "count": count, "instances": instances}
+    return {"shard": info, "tests": tests}
+
+
+class MergeTests(unittest.TestCase):
+    def test_complete(self):
+        results, problems = report.merge([_report(i, 3) for i in [2, 1, 3]])
+        self.assertEqual(problems, [])
+        self.assertEqual(
+            [(r["file"], r["instance"]) for r in results],
+            [("a.test", 0), ("a.test", 1), ("a.test", 2), ("b.test", 0)],
+        )
+
+    def test_missing_shard(self):
+        results, problems = report.merge([_report(1, 3), _report(3, 3)])
+        self.assertEqual(len(results), 3)
+        self.assertIn("shard 2/3 is missing", problems)
+        self.assertIn(
+            "a.test: 1 of 3 instance(s) missing, starting with #2", problems
+        )
+
+    def test_repeated_shard(self):
+        reports = [_report(1, 2), _report(2, 2), _report(2, 2)]
+        results, problems = report.merge(reports)
+        self.assertEqual(len(results), 4)
+        self.assertIn("shard 2/2 appears 2 times", problems)
+        self.assertIn("a.test #2 was run more than once", problems)
+
+    def test_different_runs(self):
+        _, problems = report.merge([_report(1, 2), _report(2, 3)])
+        self.assertIn("reports come from runs split [2, 3] ways", problems)
+
+    def test_not_a_shard(self):
+        unsharded = {"tests": _report(1, 1)["tests"]}
+        _, problems = report.merge([unsharded])
+        self.assertEqual(problems, ["1 report(s) are not from a shard"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import result_cache
+
+
+################################################################################
+# The on-disk result cache
+################################################################################
+
+_out = "mp: SAT, outcome permitted, matches expectation\n"
+
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        result_cache.set_enabled(True)
+        result_cache.set_directory(directory.name)
+        result_cache.set_max_size(256 * 1024 * 1024)
+        self.model = os.path.join(directory.name, "model.als")
+        with open(self.model, "w") as f:
+            f.write("module ptx\n")
+
+    def stored(self):
+        "the bytes actually stored in the cache"
+        return sum(s for _, s, _ in result_cache._entries())
+
+    def test_miss_and_hit(self):
+        key = result_cache.key(self.model, "test")
+        self.assertIsNone(result_cache.get(key))
+        result_cache.put(key, 0, _out)
+        self.assertEqual(result_cache.get(key), (0, _out))
+
+    def test_indefinite_results(self):
+        for status in [1, 11]:
+            key = result_cache.key(self.model, f"test {status}")
+            result_cache.put(key, status, _out)
+            self.assertIsNone(result_cache.get(key))
+
+    def test_disabled(self):
+        key = result_cache.key(self.model, "test")
+        result_cache.set_enabled(False)
+        result_cache.put(key, 0, _out)
+        result_cache.set_enabled(True)
+        self.assertIsNone(result_cache.get(key))
+
+    def test_keys(self):
+        key = result_cache.key(self.model, "test")
+        self.assertEqual(key, result_cache.key(self.model, "test"))
+        self.assertNotEqual(key, result_cache.key(self.model, "other"))
+        self.assertNotEqual(
+            key, result_cache.key(self.model, "test", {"solver": "minisat"})
+        )
+        with open(self.model, "a") as f:
+            f.write("// changed\n")
+        os.utime(self.model, ns=(0, 0))
+        self.assertNotEqual(key, result_cache.key(self.model, "test"))
+
+    def test_overwrite(self):
+        key = result_cache.key(self.model, "test")
+        result_cache.put(key, 0, _out)
+        for n in range(20):
+            result_cache.put(key, 10, _out * (n % 3 + 1))
+            self.assertEqual(result_cache._size, self.stored())
+        self.assertEqual(result_cache.get(key), (10, _out * 2))
+
+    def test_eviction(self):
+        keys = [result_cache.key(self.model, f"test {n}") for n in range(8)]
+        for n, key in enumerate(keys):
+            result_cache.put(key, 0, _out)
+            # Oldest first, except that the first is the most recently used
+            t = 1000 + (100 if n == 0 else n)
+            os.utime(result_cache._path(key), (t, t))
+        entry = self.stored() // len(keys)
+        result_cache.set_max_size(len(keys) * entry)
+        result_cache.put(result_cache.key(self.model, "one more"), 0, _out)
+        self.assertLessEqual(result_cache._size, len(keys) * entry * 3 // 4)
+        self.assertEqual(result_cache._size, self.stored())
+        self.assertIsNotNone(result_cache.get(keys[0]))
+        self.assertIsNone(result_cache.get(keys[1]))
+        self.assertIsNotNone(result_cache.get(keys[-1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import template
+
+
+################################################################################
+# Template expansion
+################################################################################
+
+_test = """.global x;
+d0.b0.t0 {
+  $0 [x], 1;
+}
+d0.b1.t0 {
+  ld.weak r0, [x];
+}
+$1 (r0 == 1) as c;
+"""
+
+
+class TemplateTests(unittest.TestCase):
+    def test_inline(self):
+        t = template.Template(_test + "$$\n# comment\nst.weak | permit\n\n")
+        self.assertEqual(len(t), 1)
+        [(parameters, text)] = list(t)
+        self.assertEqual(parameters, "st.weak | permit")
+        self.assertIn("st.weak [x], 1;", text)
+        self.assertIn("permit (r0 == 1) as c;", text)
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "params"), "w") as f:
+                f.write("st.weak | permit\n# comment\n\nst.relaxed.gpu | forbid\n")
+            t = template.Template(_test + "$$ file params\n", directory)
+            self.assertEqual(t.parameter_file, os.path.join(directory, "params"))
+            self.assertEqual(len(t), 2)
+            self.assertEqual(
+                [p for p, _ in t], ["st.weak | permit", "st.relaxed.gpu | forbid"]
+            )
+
+    def test_product(self):
+        t = template.Template(
+            _test + "$$ product\n$0: st.weak | st.relaxed.gpu\n$1: permit | forbid\n"
+        )
+        self.assertEqual(len(t), 4)
+        self.assertEqual(
+            [p for p, _ in t],
+            [
+                "st.weak | permit",
+                "st.weak | forbid",
+                "st.relaxed.gpu | permit",
+                "st.relaxed.gpu | forbid",
+            ],
+        )
+
+    def test_product_needs_every_slot(self):
+        with self.assertRaises(template.TemplateException):
+            template.Template(_test + "$$ product\n$1: permit\n")
+
+    def test_unknown_source(self):
+        with self.assertRaises(template.TemplateException):
+            template.Template(_test + "$$ somewhere\n")
+
+    def test_missing_parameters_stay(self):
+        t = template.Template(_test + "$$\n")
+        self.assertIn("$1 (r0 == 1)", t.instantiate(["st.weak"]))
+
+
+if __name__ == "__main__":
+    unittest.main()